@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
 
+import datetime
+
 from flask_script import Manager
 from flask_migrate import Migrate
 from flask_migrate import MigrateCommand
 
 from seisma import wsgi
+from seisma import json
 from seisma import constants
+from seisma.database import stat
+from seisma.database import rollups
+from seisma.database import metadata
+from seisma.database import retention
 from seisma.database.alchemy import alchemy
 
 
@@ -13,6 +20,65 @@ manager = Manager(wsgi.app)
 migrate = Migrate(wsgi.app, alchemy, directory=constants.MIGRATE_DIR)
 
 
+def to_date(string):
+    return datetime.datetime.strptime(string, json.DATE_FORMAT).date()
+
+
+@MigrateCommand.option('-f', '--date-from', dest='date_from', type=to_date, default=None)
+@MigrateCommand.option('-t', '--date-to', dest='date_to', type=to_date, default=None)
+def rebuild_rollups(date_from, date_to):
+    """
+    Rebuild daily rollups from case results and finished builds
+    """
+    days = wsgi.app.config.get('RETENTION', {}).get('DAYS')
+
+    if days:
+        # rollups of archived case results can not be rebuilt
+        cutoff = retention.get_cutoff(days).date()
+
+        if date_from is None or date_from < cutoff:
+            date_from = cutoff
+
+    rollups.rebuild(date_from=date_from, date_to=date_to)
+
+
+@MigrateCommand.option('-d', '--days', dest='days', type=int, default=None)
+def archive_case_results(days):
+    """
+    Move case results older than retention period to archive file
+    """
+    path, count = retention.archive_by_config(wsgi.app, days=days)
+
+    if count:
+        print('{} case results have been archived to {}'.format(count, path))
+    else:
+        print('There are no case results to archive')
+
+
+@MigrateCommand.option('-c', '--chunk-size', dest='chunk_size', type=int, default=metadata.DEFAULT_CHUNK_SIZE)
+@MigrateCommand.option('--delete-rows', dest='delete_rows', action='store_true', default=False)
+def convert_metadata(chunk_size, delete_rows):
+    """
+    Convert metadata rows of builds and case results to documents
+    """
+    from seisma.database import schema as db
+
+    for model in (db.Build, db.CaseResult):
+        count = metadata.convert_to_documents(model, chunk_size=chunk_size, delete_rows=delete_rows)
+        print('Metadata of {} rows of {} have been converted'.format(count, model.__tablename__))
+
+
+@MigrateCommand.option('-c', '--chunk-size', dest='chunk_size', type=int, default=stat.FINGERPRINT_CHUNK_SIZE)
+@MigrateCommand.option('--recompute', dest='recompute', action='store_true', default=False)
+def fingerprint_case_results(chunk_size, recompute):
+    """
+    Compute fingerprints of reasons of failed case results added before fingerprints,
+    all of them are computed again with --recompute
+    """
+    count = stat.fill_fingerprints(chunk_size=chunk_size, recompute=recompute)
+    print('Fingerprints of {} case results have been computed'.format(count))
+
+
 manager.add_command('db', MigrateCommand)
 
 
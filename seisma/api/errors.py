@@ -17,6 +17,7 @@ EXCEPTION_CLASS_TO_STATUS_CODE = (
     (exceptions.ValidationError, 400),
     (IntegrityError, 409),
     (exceptions.NotFound, 404),
+    (exceptions.RequestEntityTooLarge, 413),
     (exceptions.BaseSeismaException, 500),
     (Exception, 500),
 )
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import io
+import csv
+import datetime
+
+import flask
+
+from .. import json
+from .. import exceptions
+
+
+CHUNK_SIZE = 64 * 1024
+
+NDJSON_MIME_TYPE = 'application/x-ndjson'
+CSV_MIME_TYPE = 'text/csv'
+
+
+def to_csv_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime(json.DATETIME_FORMAT)
+
+    if isinstance(value, datetime.date):
+        return value.strftime(json.DATE_FORMAT)
+
+    return value
+
+
+def iter_ndjson(fields, rows):
+    chunk = []
+    size = 0
+
+    for row in rows:
+        line = json.dumps(dict(zip(fields, row))) + '\n'
+        chunk.append(line)
+        size += len(line)
+
+        if size >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+
+    if chunk:
+        yield ''.join(chunk)
+
+
+def iter_csv(fields, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(fields)
+
+    for row in rows:
+        writer.writerow([to_csv_value(v) for v in row])
+
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+FORMATS = {
+    'ndjson': (iter_ndjson, NDJSON_MIME_TYPE),
+    'csv': (iter_csv, CSV_MIME_TYPE),
+}
+
+
+def make_stream_response(fields, rows, format, filename):
+    """
+    Stream rows in format, rows are iterated while response is sent.
+    """
+    try:
+        iter_format, mimetype = FORMATS[format]
+    except KeyError:
+        raise exceptions.ValidationError(
+            '"{}" is not in ({})'.format(format, ', '.join(sorted(FORMATS))),
+        )
+
+    return flask.Response(
+        flask.stream_with_context(iter_format(fields, rows)),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': 'attachment; filename={}.{}'.format(filename, format),
+        },
+    )
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import os
+import time
 import logging
 from functools import wraps
 
@@ -19,6 +20,13 @@ logger = logging.getLogger(__name__)
 BASE_API_PATH_INFO = '/api'
 DEFAULT_RESOURCE_VERSION = 1
 
+DEFAULT_MAX_BODY_SIZE = 32 * 1024 * 1024
+
+READ_ONLY_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+CONSISTENT_READ_PARAM = 'consistent'
+CONSISTENT_READ_HEADER = 'X-Consistent-Read'
+
 SCHEMAS_PATH = os.path.abspath(
     os.path.join(
         os.path.dirname(__file__),
@@ -27,13 +35,87 @@ SCHEMAS_PATH = os.path.abspath(
 )
 
 
-def validate_inputs_decorator(f, schema):
+def make_validator(schema):
+    """
+    Check schema and create validator of it once for a route.
+    """
+    validator_class = jsonschema.validators.validator_for(schema)
+    validator_class.check_schema(schema)
+
+    return validator_class(schema, format_checker=jsonschema.FormatChecker())
+
+
+class CappedStream(object):
+    """
+    Input stream what fails when more than limit bytes are read from it.
+    """
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.limit = limit
+        self.pos = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.limit - self.pos:
+            size = self.limit - self.pos + 1
+
+        data = self.stream.read(size)
+        self.pos += len(data)
+
+        if self.pos > self.limit:
+            raise exceptions.RequestEntityTooLarge(
+                'Request body is larger than {} bytes'.format(self.limit),
+            )
+
+        return data
+
+
+def check_body_size(request):
+    config = flask.current_app.config.get('API', {})
+    max_body_size = config.get('MAX_BODY_SIZE', DEFAULT_MAX_BODY_SIZE)
+
+    if request.content_length is not None and request.content_length > max_body_size:
+        raise exceptions.RequestEntityTooLarge(
+            'Request body is larger than {} bytes'.format(max_body_size),
+        )
+
+    if request.environ.get('wsgi.input_terminated'):
+        # server dechunks body of unknown length, so raw input is capped while it's read.
+        # Without this flag werkzeug reads body of unknown length as empty.
+        request.stream = CappedStream(request.environ['wsgi.input'], max_body_size)
+
+
+def validate_inputs_decorator(f, validator):
     @wraps(f)
     def wrapper(*args, **kwargs):
+        check_body_size(flask.request)
+
+        data = flask.request.json
+        started = time.time()
+
         try:
-            jsonschema.validate(flask.request.json, schema)
+            validator.validate(data)
         except jsonschema.ValidationError as error:
             raise exceptions.ValidationError(*[e for e in error.args if isinstance(e, str)])
+        finally:
+            flask.g.validation_time = getattr(flask.g, 'validation_time', 0.0) + time.time() - started
+
+        return f(*args, **kwargs)
+    return wrapper
+
+
+def is_consistent_read(request):
+    return 'true' in (
+        request.args.get(CONSISTENT_READ_PARAM),
+        request.headers.get(CONSISTENT_READ_HEADER),
+    )
+
+
+def replica_decorator(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        # consistent read is taken from primary
+        flask.g.use_replica = not is_consistent_read(flask.request)
         return f(*args, **kwargs)
     return wrapper
 
@@ -57,14 +139,17 @@ def response_decorator(f):
     return wrapper
 
 
-def decorate_view(f, schema=None):
+def decorate_view(f, validator=None, read_only=False):
     @wraps(f)
     def wrapper(view):
         view = not_found_decorator(view)
 
-        if schema is not None:
+        if read_only:
+            view = replica_decorator(view)
+
+        if validator is not None:
             view = validate_inputs_decorator(
-                view, schema,
+                view, validator,
             )
 
         view = response_decorator(view)
@@ -89,16 +174,18 @@ class ApiResource(flask.Blueprint):
         rule = '{}/v{}{}'.format(BASE_API_PATH_INFO, version, rule)
 
         schema = options.pop('schema', None)
+        validator = None
 
         if schema:
             schema_path = os.path.join(SCHEMAS_PATH, 'v{}'.format(version), schema)
 
             with open(schema_path) as fp:
-                schema = json.load(fp)
+                validator = make_validator(json.load(fp))
 
         return decorate_view(
             super(ApiResource, self).route(rule, **options),
-            schema=schema,
+            validator=validator,
+            read_only=READ_ONLY_METHODS.issuperset(options.get('methods', ['GET'])),
         )
 
     def setup_error_handlers(self):
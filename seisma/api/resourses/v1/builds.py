@@ -3,19 +3,29 @@
 from http import HTTPStatus as statuses
 
 import flask
-from sqlalchemy import desc
 
 from ... import string
+from .... import spool
+from .... import exceptions
 from ...result import make_result
 from ...utils import api_location
+from ...response import cache_headers
 from ...resource import ApiResource
 from ...utils import paginated_query
+from ...utils import filter_by_metadata
+from ....database import stat
+from ....database import cache
+from ....database import metadata as storage
+from ....database import rollups
 from ....database import schema as db
+from ....database.alchemy import alchemy
 from ....constants import API_AUTO_CREATION_PARAM
 
 
 VERSION = 1
 
+DEFAULT_DIFF_CATEGORY = 'new_failures'
+
 
 resource = ApiResource(__name__, version=VERSION)
 
@@ -30,6 +40,10 @@ def get_builds_from_job(job_name):
 
     GET params
 
+        * from: for pagination. (integer)
+        * to: for pagination. (integer)
+        * cursor: for keyset pagination, empty for the first page. (string)
+        * limit: count of records on page for keyset pagination. (integer)
         * date_to: where data less or equal than value.
         * date_from: where data more or equal than value.
         * runtime_more: where runtime more than value. (float)
@@ -41,6 +55,8 @@ def get_builds_from_job(job_name):
         * success_count_more: where success count more than value. (integer)
         * success_count_less: where success count less than value. (integer)
         * was_success: was success after run build, yes or no. choice from (true, false).
+        * md.<key>: where metadata key equals to value, e.g. md.branch=master.
+            Only indexed keys with document storage of metadata.
     """
     job = db.Job.get_by_name(job_name)
 
@@ -65,7 +81,6 @@ def get_builds_from_job(job_name):
             filters['was_success'] = string.to_bool(was_success)
 
         query = db.Build.query.filter_by(**filters)
-        query = query.order_by(desc(db.Build.date))
 
         if date_from is not None:
             date_from = string.to_datetime(date_from, no_time=True)
@@ -95,13 +110,15 @@ def get_builds_from_job(job_name):
         elif success_count_less is not None:
             query = query.filter(db.Build.success_count < string.to_int(success_count_less))
 
-        query = paginated_query(query, flask.request)
+        query = filter_by_metadata(query, db.Build, flask.request, storage.is_filterable)
+
+        builds, page = paginated_query(query, flask.request, db.Build.date, db.Build.id)
+        db.Build.md.preload(builds)
 
         return make_result(
-            query.all(),
-            total_count=query.total_count,
-            current_count=query.current_count,
+            builds,
             job=job,
+            **page
         ), statuses.OK
 
 
@@ -124,11 +141,32 @@ def start_build(job_name, build_name):
 
         * metadata: dictionary with contains info about your build.
             Key and value can be of string type only.
+
+    When ingest spool is enabled then build is created in background
+    and response has status 202 Accepted.
     """
+    if spool.is_enabled():
+        json = flask.request.get_json()
+
+        spool.append_build(
+            job_name, build_name, json.get('metadata'),
+            autocreation=bool(flask.request.args.get(API_AUTO_CREATION_PARAM)),
+        )
+
+        return make_result(
+            json,
+            location=api_location(
+                '/jobs/{}/builds/{}',
+                job_name, build_name,
+                version=VERSION,
+            ),
+        ), statuses.ACCEPTED
+
     job = db.Job.get_by_name(job_name)
 
     if not job and flask.request.args.get(API_AUTO_CREATION_PARAM):
         job = db.Job.create(name=job_name, is_active=True)
+        cache.remember_job(job)
 
     if job:
         json = flask.request.get_json()
@@ -147,11 +185,13 @@ def start_build(job_name, build_name):
         }
         metadata = json.get('metadata')
 
-        build = db.Build.create(**data)
+        build = db.Build.create(commit=False, **data)
 
         if metadata:
             build.md = metadata
 
+        alchemy.session.commit()
+
         return make_result(
             build,
             job=job,
@@ -179,32 +219,60 @@ def stop_build(job_name, build_name):
 
     JSON params:
 
+        * from_results: take counts from case results of build (boolean)
         * runtime: time of execution (float, required)
         * was_success: was success or no (boolean, required)
         * tests_count: (integer, required)
         * success_count: (integer, required)
         * fail_count: (integer, required)
         * error_count: (integer, required)
+        * metadata: dictionary what will be merged into metadata of build.
+            Key and value can be of string type only.
+
+    With from_results counts are not required and taken from case results.
+    Runtime is sum of runtime of case results if it's not passed,
+    build was success if it has no failed and error case results by default.
+
+    When ingest spool is enabled then it's flushed before.
     """
+    spool.flush_current()
+
     job = db.Job.get_by_name(job_name)
 
     if job:
-        build = db.Build.query.filter_by(
-            job_id=job.id, name=build_name,
-        ).first()
+        build = db.Build.get_by_name(job.id, build_name)
 
         if build:
             json = flask.request.get_json()
 
-            data = {
-                'is_running': False,
-                'runtime': json.get('runtime'),
-                'was_success': json.get('was_success'),
-                'tests_count': json.get('tests_count'),
-                'success_count': json.get('success_count'),
-                'fail_count': json.get('fail_count'),
-                'error_count': json.get('error_count'),
-            }
+            if json.get('from_results'):
+                data = stat.totals_of_build(build.id)
+                data.update(
+                    is_running=False,
+                    was_success=data['fail_count'] == 0 and data['error_count'] == 0,
+                )
+
+                for key in ('runtime', 'was_success'):
+                    if json.get(key) is not None:
+                        data[key] = json[key]
+            else:
+                data = {
+                    'is_running': False,
+                    'runtime': json.get('runtime'),
+                    'was_success': json.get('was_success'),
+                    'tests_count': json.get('tests_count'),
+                    'success_count': json.get('success_count'),
+                    'fail_count': json.get('fail_count'),
+                    'error_count': json.get('error_count'),
+                }
+            metadata = json.get('metadata')
+
+            if metadata:
+                db.Build.md.merge(build, metadata)
+
+            if build.is_running:
+                rollups.add_build(job.id, build.date, data['was_success'], data['runtime'])
+
             build.update(**data)
 
             return make_result(
@@ -222,6 +290,7 @@ def stop_build(job_name, build_name):
 def get_build_by_name(job_name, build_name):
     """
     Get only one build by name.
+    Finished build has ETag and can be requested with If-None-Match.
 
     METHOD: GET
     PATH: /api/v1/jobs/<string:job_name>/builds/<string:build_name>
@@ -229,12 +298,81 @@ def get_build_by_name(job_name, build_name):
     job = db.Job.get_by_name(job_name)
 
     if job:
-        build = db.Build.query.filter_by(
-            job_id=job.id, name=build_name,
-        ).first()
+        build = db.Build.get_by_name(job.id, build_name)
 
         if build:
+            headers = None
+
+            if not build.is_running:
+                headers = cache_headers(*build.version_stamp())
+
             return make_result(
                 build,
                 job=job,
+            ), statuses.OK, headers
+
+
+@resource.route(
+    '/jobs/<string:job_name>/builds/<string:build_name>/diff/<string:other_build_name>',
+    methods=['GET'],
+)
+def get_diff_of_builds(job_name, build_name, other_build_name):
+    """
+    Compare case results of build with other (reference) build.
+    Counts of all categories are in extra, cases of one category are in result.
+
+    Categories:
+
+        * new_failures: failed in build, passed in other build
+        * fixed: passed in build, failed in other build
+        * still_failing: failed in both builds
+        * added: run in build only
+        * removed: run in other build only
+
+    Error status is counted as failed.
+
+    METHOD: GET
+    PATH: /api/v1/jobs/<string:job_name>/builds/<string:build_name>/diff/<string:other_build_name>
+
+    GET params
+
+        * category: category of cases in result, new_failures by default.
+        * from: for pagination. (integer)
+        * to: for pagination. (integer)
+        * cursor: for keyset pagination, empty for the first page. (string)
+        * limit: count of records on page for keyset pagination. (integer)
+    """
+    category = flask.request.args.get('category', DEFAULT_DIFF_CATEGORY)
+
+    if category not in stat.DIFF_CATEGORIES:
+        raise exceptions.ValidationError(
+            'Category should be in ({})'.format(', '.join(stat.DIFF_CATEGORIES)),
+        )
+
+    job = db.Job.get_by_name(job_name)
+
+    if job:
+        build = db.Build.get_by_name(job.id, build_name)
+        other_build = db.Build.get_by_name(job.id, other_build_name)
+
+        if build and other_build:
+            make_query, counts = stat.diff_of_builds(build.id, other_build.id)
+
+            rows, page = paginated_query(make_query(category), flask.request, db.Case.id)
+
+            return make_result(
+                [
+                    {
+                        'case': row.name,
+                        'status': row.status,
+                        'other_status': row.other_status,
+                    }
+                    for row in rows
+                ],
+                job=job,
+                build=build,
+                other_build=other_build,
+                category=category,
+                counts=counts,
+                **page
             ), statuses.OK
@@ -1,25 +1,83 @@
 # -*- coding: utf-8 -*-
 
+import datetime
 from http import HTTPStatus as statuses
 
 import flask
 from sqlalchemy import desc
+from sqlalchemy.orm import joinedload
 
+from ... import export
 from ... import string
+from .... import spool
+from .... import exceptions
 from ...result import make_result
 from ...utils import api_location
+from ...response import cache_headers
 from ...resource import ApiResource
 from ...utils import paginated_query
+from ...utils import get_limit
+from ...utils import iter_keyset_chunks
+from ...utils import filter_by_metadata
+from ....database import stat
+from ....database import cache
+from ....database import ingest
+from ....database import metadata as storage
+from ....database import rollups
 from ....database import schema as db
+from ....database.alchemy import alchemy
 from ....constants import API_AUTO_CREATION_PARAM
 
 
 VERSION = 1
 
 
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_FIELDS = ('case', 'build', 'date', 'status', 'runtime', 'reason')
+
+DEFAULT_FLAKY_LIMIT = 20
+DEFAULT_FLAKY_BUILDS = 50
+MAX_FLAKY_BUILDS = 1000
+
+DEFAULT_FAILURES_DAYS = 7
+DEFAULT_FAILURES_LIMIT = 50
+DEFAULT_FAILURES_SAMPLES = 5
+MAX_FAILURES_LIMIT = 1000
+MAX_FAILURES_SAMPLES = 100
+
+
 resource = ApiResource(__name__, version=VERSION)
 
 
+def filter_case_results(query, request):
+    """
+    Apply filters of case results from GET params of request.
+    """
+    status = request.args.get('status', None)
+    date_to = request.args.get('date_to', None)
+    date_from = request.args.get('date_from', None)
+    runtime_more = request.args.get('runtime_more', None)
+    runtime_less = request.args.get('runtime_less', None)
+
+    if status in db.CASE_STATUSES_CHOICE:
+        query = query.filter(db.CaseResult.status == status)
+
+    if date_from is not None:
+        date_from = string.to_datetime(date_from, no_time=True)
+        query = query.filter(db.CaseResult.date >= date_from)
+
+    if date_to is not None:
+        date_to = string.to_datetime(date_to, no_time=True, to_end_day=True)
+        query = query.filter(db.CaseResult.date <= date_to)
+
+    if runtime_more is not None:
+        query = query.filter(db.CaseResult.runtime > string.to_float(runtime_more))
+    elif runtime_less is not None:
+        query = query.filter(db.CaseResult.runtime < string.to_float(runtime_less))
+
+    return filter_by_metadata(query, db.CaseResult, request, storage.is_filterable)
+
+
 @resource.route('/jobs/<string:job_name>/cases/<string:case_name>', methods=['GET'])
 def get_case_from_job(job_name, case_name):
     """
@@ -31,7 +89,7 @@ def get_case_from_job(job_name, case_name):
     job = db.Job.get_by_name(job_name)
 
     if job:
-        case = db.Case.query.filter_by(job_id=job.id, name=case_name).first()
+        case = db.Case.get_by_name(job.id, case_name)
 
         if case:
             return make_result(
@@ -67,6 +125,7 @@ def add_case_to_job(job_name, case_name):
             'description': json.get('description', ''),
         }
         case = db.Case.create(**data)
+        cache.remember_case(case)
 
         return make_result(
             case,
@@ -91,19 +150,140 @@ def get_cases_from_job(job_name):
 
         * from: for pagination. (integer)
         * to: for pagination. (integer)
+        * cursor: for keyset pagination, empty for the first page. (string)
+        * limit: count of records on page for keyset pagination. (integer)
     """
     job = db.Job.get_by_name(job_name)
 
     if job:
         query = db.Case.query.filter_by(job_id=job.id)
-        query = query.order_by(desc(db.Case.created))
-        query = paginated_query(query, flask.request)
+        cases, page = paginated_query(query, flask.request, db.Case.created, db.Case.id)
+
+        return make_result(
+            cases,
+            job=job,
+            **page
+        ), statuses.OK
+
+
+@resource.route('/jobs/<string:job_name>/flaky', methods=['GET'])
+def get_flaky_cases_from_job(job_name):
+    """
+    Get the most flaky cases from job.
+    Flip is change of status between passed and failed (or error)
+    in neighbour builds where case was run, skipped are not counted.
+
+    METHOD: GET
+    PATH: /api/v1/jobs/<string:job_name>/flaky
+
+    GET params
+
+        * builds: count of last builds to look at, 50 by default. (integer)
+        * limit: count of cases, 20 by default. (integer)
+    """
+    job = db.Job.get_by_name(job_name)
+
+    if job:
+        builds_count = string.to_int(flask.request.args.get('builds', DEFAULT_FLAKY_BUILDS))
+        limit = get_limit(flask.request, default=DEFAULT_FLAKY_LIMIT)
+
+        if not 0 < builds_count <= MAX_FLAKY_BUILDS:
+            raise exceptions.ValidationError(
+                'Count of builds should be from 1 to {}'.format(MAX_FLAKY_BUILDS),
+            )
+
+        flaky = stat.flaky_cases(job.id, builds_count, limit)
+        cases = dict(
+            (c.id, c) for c in db.Case.query.filter(db.Case.id.in_([f[0] for f in flaky]))
+        ) if flaky else {}
 
         return make_result(
-            query.all(),
+            [
+                {
+                    'case': cases[case_id],
+                    'runs': runs,
+                    'flips': flips,
+                    'flip_rate': flip_rate,
+                    'failure_rate': failure_rate,
+                }
+                for case_id, runs, flips, flip_rate, failure_rate in flaky
+            ],
             job=job,
-            total_count=query.total_count,
-            current_count=query.current_count,
+            builds=builds_count,
+        ), statuses.OK
+
+
+@resource.route('/jobs/<string:job_name>/failures', methods=['GET'])
+def get_failures_from_job(job_name):
+    """
+    Get groups of failed case results of job by fingerprint of reason.
+    Fingerprint is hash of reason without addresses, line numbers,
+    temporary paths and timestamps, groups are ordered by count.
+
+    METHOD: GET
+    PATH: /api/v1/jobs/<string:job_name>/failures
+
+    GET params
+
+        * build: name of build, date range is not used with build.
+        * date_from: range from date (last 7 days by default)
+        * date_to: range to date (today by default)
+        * limit: count of groups, 50 by default, 1000 at most. (integer)
+        * samples: count of sample cases in group, 5 by default, 100 at most. (integer)
+    """
+    job = db.Job.get_by_name(job_name)
+
+    if job:
+        build_name = flask.request.args.get('build', None)
+        limit = get_limit(flask.request, default=DEFAULT_FAILURES_LIMIT, maximum=MAX_FAILURES_LIMIT)
+        samples = string.to_int(flask.request.args.get('samples', DEFAULT_FAILURES_SAMPLES))
+
+        if not 0 < samples <= MAX_FAILURES_SAMPLES:
+            raise exceptions.ValidationError(
+                'Count of samples should be from 1 to {}'.format(MAX_FAILURES_SAMPLES),
+            )
+
+        query = db.CaseResult.query.join(
+            db.Case, db.Case.id == db.CaseResult.case_id,
+        ).filter(db.Case.job_id == job.id)
+
+        extra = {}
+
+        if build_name is not None:
+            build = db.Build.get_by_name(job.id, build_name)
+
+            if not build:
+                return None
+
+            query = query.filter(db.CaseResult.build_id == build.id)
+            extra['build'] = build
+        else:
+            date_to = flask.request.args.get('date_to', None)
+            date_from = flask.request.args.get('date_from', None)
+
+            if date_to is not None:
+                date_to = string.to_datetime(date_to, no_time=True, to_end_day=True)
+            else:
+                date_to = datetime.datetime.combine(datetime.date.today(), datetime.time.max)
+
+            if date_from is not None:
+                date_from = string.to_datetime(date_from, no_time=True)
+            else:
+                date_from = datetime.datetime.combine(
+                    date_to.date() - datetime.timedelta(days=DEFAULT_FAILURES_DAYS - 1),
+                    datetime.time.min,
+                )
+
+            query = query.filter(
+                db.CaseResult.date >= date_from,
+                db.CaseResult.date <= date_to,
+            )
+            extra.update(date_from=date_from.date(), date_to=date_to.date())
+
+        return make_result(
+            stat.failure_groups(query, limit, samples),
+            job=job,
+            **extra
         ), statuses.OK
 
 
@@ -119,51 +299,47 @@ def get_stats_of_case_from_job(job_name, case_name):
 
         * from: for pagination. (integer)
         * to: for pagination. (integer)
+        * cursor: for keyset pagination, empty for the first page. (string)
+        * limit: count of records on page for keyset pagination. (integer)
         * status: can be in (passed, skipped, failed, error)
         * date_from: range from date (use with date_to only)
         * date to: range to date (use with date_from only)
         * runtime_more: where runtime more than value. (float)
         * runtime_less: where runtime less than value. (float)
+        * md.<key>: where metadata key equals to value, e.g. md.browser=firefox.
+            Only indexed keys with document storage of metadata.
+        * aggregate: return summary instead of case results,
+            choice from (true, false). Summary contains counts by status,
+            pass rate (skipped are not counted) and runtime min, avg, max, p50, p95, p99.
     """
     job = db.Job.get_by_name(job_name)
 
     if job:
-        case = db.Case.query.filter_by(job_id=job.id, name=case_name).first()
+        case = db.Case.get_by_name(job.id, case_name)
 
         if case:
-            status = flask.request.args.get('status', None)
-            date_to = flask.request.args.get('date_to', None)
-            date_from = flask.request.args.get('date_from', None)
-            runtime_more = flask.request.args.get('runtime_more', None)
-            runtime_less = flask.request.args.get('runtime_less', None)
+            aggregate = flask.request.args.get('aggregate', None)
 
             query = db.CaseResult.query.filter_by(case_id=case.id)
+            query = filter_case_results(query, flask.request)
 
-            if status in db.CASE_STATUSES_CHOICE:
-                query = query.filter(db.CaseResult.status == status)
-
-            if date_from is not None:
-                date_from = string.to_datetime(date_from, no_time=True)
-                query = query.filter(db.CaseResult.date >= date_from)
-
-            if date_to is not None:
-                date_to = string.to_datetime(date_to, no_time=True, to_end_day=True)
-                query = query.filter(db.CaseResult.date <= date_to)
-
-            if runtime_more is not None:
-                query = query.filter(db.CaseResult.runtime > string.to_float(runtime_more))
-            elif runtime_less is not None:
-                query = query.filter(db.CaseResult.runtime < string.to_float(runtime_less))
+            if aggregate is not None and string.to_bool(aggregate):
+                return make_result(
+                    stat.summary_of_case_results(query),
+                    job=job,
+                    case=case,
+                ), statuses.OK
 
-            query = query.order_by(desc(db.CaseResult.date))
-            query = paginated_query(query, flask.request)
+            case_results, page = paginated_query(
+                query, flask.request, db.CaseResult.date, db.CaseResult.id,
+            )
+            db.CaseResult.md.preload(case_results)
 
             return make_result(
-                query.all(),
+                case_results,
                 job=job,
                 case=case,
-                total_count=query.total_count,
-                current_count=query.current_count,
+                **page
             ), statuses.OK
 
 
@@ -186,17 +362,38 @@ def add_case_to_build(job_name, build_name, case_name):
         * reason: crush's reason (string)
         * metadata: dictionary with contains info about case result.
             Key and value can be of string type only.
+
+    When ingest spool is enabled then case result is created in background
+    and response has status 202 Accepted.
     """
+    if spool.is_enabled():
+        json = flask.request.get_json()
+
+        spool.append_case_result(
+            job_name, build_name, case_name, json,
+            autocreation=bool(flask.request.args.get(API_AUTO_CREATION_PARAM)),
+        )
+
+        return make_result(
+            json,
+            location=api_location(
+                '/jobs/{}/builds/{}/cases/{}',
+                job_name, build_name, case_name,
+                version=VERSION,
+            ),
+        ), statuses.ACCEPTED
+
     job = db.Job.get_by_name(job_name)
 
     if job:
-        build = db.Build.query.filter_by(job_id=job.id, name=build_name).first()
+        build = db.Build.get_by_name(job.id, build_name)
 
         if build:
-            case = db.Case.query.filter_by(job_id=job.id, name=case_name).first()
+            case = db.Case.get_by_name(job.id, case_name)
 
             if not case and flask.request.args.get(API_AUTO_CREATION_PARAM):
                 case = db.Case.create(name=case_name, job_id=job.id)
+                cache.remember_case(case)
 
             if case:
                 json = flask.request.get_json()
@@ -210,11 +407,20 @@ def add_case_to_build(job_name, build_name, case_name):
                 }
                 metadata = json.get('metadata')
 
-                case_result = db.CaseResult.create(**data)
+                case_result = db.CaseResult.create(commit=False, **data)
 
                 if metadata:
                     case_result.md = metadata
 
+                rollups.add_case_results([(
+                    case_result.case_id,
+                    case_result.date,
+                    case_result.status,
+                    case_result.runtime,
+                )])
+
+                alchemy.session.commit()
+
                 return make_result(
                     case_result,
                     job=job,
@@ -228,6 +434,51 @@ def add_case_to_build(job_name, build_name, case_name):
                 ), statuses.CREATED
 
 
+@resource.route(
+    '/jobs/<string:job_name>/builds/<string:build_name>/cases',
+    methods=['POST'],
+    schema='case_results.post.json',
+)
+def add_cases_to_build(job_name, build_name):
+    """
+    Add many case results to a build in one transaction.
+    Result is a list of outcomes in order of the case results.
+
+    METHOD: POST
+    PATH: /api/v1/jobs/<string:job_name>/builds/<string:build_name>/cases
+
+    JSON params
+
+        list of objects with keys
+
+        * name: name of case (string, required)
+        * status: choice from (passed, skipped, failed, error) (required)
+        * runtime: time of execution (float, required)
+        * reason: crush's reason (string)
+        * metadata: dictionary with contains info about case result.
+            Key and value can be of string type only.
+    """
+    job = db.Job.get_by_name(job_name)
+
+    if job:
+        build = db.Build.get_by_name(job.id, build_name)
+
+        if build:
+            outcomes = ingest.add_case_results(
+                job.id, build.id, flask.request.get_json(),
+                autocreation=bool(flask.request.args.get(API_AUTO_CREATION_PARAM)),
+            )
+            created_count = sum(1 for o in outcomes if o['created'])
+
+            return make_result(
+                outcomes,
+                job=job,
+                build=build,
+                created_count=created_count,
+                failed_count=len(outcomes) - created_count,
+            ), statuses.OK
+
+
 @resource.route(
     '/jobs/<string:job_name>/builds/<string:build_name>/cases/<string:case_name>',
     methods=['GET'],
@@ -235,6 +486,7 @@ def add_case_to_build(job_name, build_name, case_name):
 def get_case_from_build(job_name, build_name, case_name):
     """
     Get only one case result from a build by case name.
+    Case result of finished build has ETag and can be requested with If-None-Match.
 
     METHOD: GET
     PATH: /api/v1/jobs/<string:job_name>/builds/<string:build_name>/cases/<string:case_name>
@@ -242,10 +494,10 @@ def get_case_from_build(job_name, build_name, case_name):
     job = db.Job.get_by_name(job_name)
 
     if job:
-        build = db.Build.query.filter_by(job_id=job.id, name=build_name).first()
+        build = db.Build.get_by_name(job.id, build_name)
 
         if build:
-            case = db.Case.query.filter_by(job_id=job.id, name=case_name).first()
+            case = db.Case.get_by_name(job.id, case_name)
 
             if case:
                 case_result = db.CaseResult.query.filter_by(
@@ -253,12 +505,17 @@ def get_case_from_build(job_name, build_name, case_name):
                 ).first()
 
                 if case_result:
+                    headers = None
+
+                    if not build.is_running:
+                        headers = cache_headers(case_result.id, *build.version_stamp())
+
                     return make_result(
                         case_result,
                         job=job,
                         case=case,
                         build=build,
-                    ), statuses.OK
+                    ), statuses.OK, headers
 
 
 @resource.route('/jobs/<string:job_name>/cases/stat')
@@ -271,47 +528,87 @@ def get_cases_stats_from_job(job_name):
 
     GET params
 
+        * from: for pagination. (integer)
+        * to: for pagination. (integer)
+        * cursor: for keyset pagination, empty for the first page. (string)
+        * limit: count of records on page for keyset pagination. (integer)
         * status: can be in (passed, skipped, failed, error)
         * date_from: range from date
         * date to: range to date
         * runtime_more: where runtime more than value. (float)
         * runtime_less: where runtime less than value. (float)
+        * md.<key>: where metadata key equals to value, e.g. md.browser=firefox.
+            Only indexed keys with document storage of metadata.
     """
     job = db.Job.get_by_name(job_name)
 
     if job:
-        status = flask.request.args.get('status', None)
-        date_to = flask.request.args.get('date_to', None)
-        date_from = flask.request.args.get('date_from', None)
-        runtime_more = flask.request.args.get('runtime_more', None)
-        runtime_less = flask.request.args.get('runtime_less', None)
-
         query = db.CaseResult.query.join(
             db.Build,
         ).filter(db.Build.job_id == job.id)
+        query = filter_case_results(query, flask.request)
 
-        if date_from is not None:
-            date_from = string.to_datetime(date_from, no_time=True)
-            query = query.filter(db.CaseResult.date >= date_from)
+        query = query.options(joinedload(db.CaseResult.case))
+        case_results, page = paginated_query(
+            query, flask.request, db.CaseResult.date, db.CaseResult.id,
+        )
+        db.CaseResult.md.preload(case_results)
 
-        if date_to is not None:
-            date_to = string.to_datetime(date_to, no_time=True, to_end_day=True)
-            query = query.filter(db.CaseResult.date <= date_to)
+        return make_result(
+            case_results,
+            job=job,
+            **page
+        ), statuses.OK
 
-        if status in db.CASE_STATUSES_CHOICE:
-            query = query.filter(db.CaseResult.status == status)
 
-        if runtime_more is not None:
-            query = query.filter(db.CaseResult.runtime > string.to_float(runtime_more))
-        elif runtime_less is not None:
-            query = query.filter(db.CaseResult.runtime < string.to_float(runtime_less))
+@resource.route('/jobs/<string:job_name>/cases/stat/export', methods=['GET'])
+def export_cases_stats_from_job(job_name):
+    """
+    Export statistic of cases from job.
+    Records are read from database by chunks and streamed.
 
-        query = query.order_by(desc(db.CaseResult.date))
-        query = paginated_query(query, flask.request)
+    METHOD: GET
+    PATH: /api/v1/jobs/<string:job_name>/cases/stat/export
 
-        return make_result(
-            query.all(),
-            job=job,
-            total_count=query.total_count,
-            current_count=query.current_count,
-        ), statuses.OK
+    GET params
+
+        * format: choice from (ndjson, csv), ndjson by default
+        * status: can be in (passed, skipped, failed, error)
+        * date_from: range from date
+        * date to: range to date
+        * runtime_more: where runtime more than value. (float)
+        * runtime_less: where runtime less than value. (float)
+        * md.<key>: where metadata key equals to value, e.g. md.browser=firefox.
+            Only indexed keys with document storage of metadata.
+    """
+    job_id = db.Job.get_id_by_name(job_name)
+
+    if job_id:
+        format = flask.request.args.get('format', 'ndjson')
+
+        query = alchemy.session.query(
+            db.Case.name,
+            db.Build.name,
+            db.CaseResult.date,
+            db.CaseResult.status,
+            db.CaseResult.runtime,
+            db.CaseResult.reason,
+            db.CaseResult.id,
+        ).select_from(
+            db.CaseResult,
+        ).join(
+            db.Build, db.CaseResult.build_id == db.Build.id,
+        ).join(
+            db.Case, db.CaseResult.case_id == db.Case.id,
+        ).filter(db.Build.job_id == job_id)
+
+        query = filter_case_results(query, flask.request)
+        query = query.order_by(desc(db.CaseResult.date), desc(db.CaseResult.id))
+
+        records = iter_keyset_chunks(
+            query, (db.CaseResult.date, db.CaseResult.id), EXPORT_CHUNK_SIZE,
+        )
+
+        return export.make_stream_response(
+            EXPORT_FIELDS, (r[:-1] for r in records), format, job_name,
+        )
@@ -3,12 +3,12 @@
 from http import HTTPStatus as statuses
 
 import flask
-from sqlalchemy import desc
 
 from ...result import make_result
 from ...utils import api_location
 from ...resource import ApiResource
 from ...utils import paginated_query
+from ....database import cache
 from ....database import schema as db
 
 
@@ -30,16 +30,13 @@ def get_jobs():
 
         * from: for pagination. (integer)
         * to: for pagination. (integer)
+        * cursor: for keyset pagination, empty for the first page. (string)
+        * limit: count of records on page for keyset pagination. (integer)
     """
     query = db.Job.query.filter_by(is_active=True)
-    query = query.order_by(desc(db.Job.created))
-    query = paginated_query(query, flask.request)
+    jobs, page = paginated_query(query, flask.request, db.Job.created, db.Job.id)
 
-    return make_result(
-        query.all(),
-        total_count=query.total_count,
-        current_count=query.current_count,
-    ), statuses.OK
+    return make_result(jobs, **page), statuses.OK
 
 
 @resource.route('/jobs/<string:job_name>', methods=['POST'], schema='job.post.json')
@@ -62,6 +59,7 @@ def create_job(job_name):
         'description': json.get('description', ''),
     }
     job = db.Job.create(**data)
+    cache.remember_job(job)
 
     return make_result(
         job,
@@ -99,4 +97,5 @@ def delete_job_by_name(job_name):
 
     if job:
         job.update(is_active=False)
+        cache.invalidate_job(job)
         return make_result(job), statuses.OK
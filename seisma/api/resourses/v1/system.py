@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+from http import HTTPStatus as statuses
+
+from ...result import make_result
+from ...resource import ApiResource
+from ....database import cache
+from ....database.alchemy import replicas
+from ....database.alchemy import get_pool_telemetry
+
+
+VERSION = 1
+
+
+resource = ApiResource(__name__, version=VERSION)
+
+
+@resource.route('/system/stats', methods=['GET'])
+def get_system_stats():
+    """
+    Get telemetry of process for tuning of settings.
+    Pool of database connections is null when connections are not pooled.
+
+    METHOD: GET
+    PATH: /api/v1/system/stats
+    """
+    return make_result({
+        'database_pool': get_pool_telemetry(),
+        'replica_pools': [get_pool_telemetry(e) for e in replicas.engines],
+        'name_cache': cache.names.stats(),
+    }), statuses.OK
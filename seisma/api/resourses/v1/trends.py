@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+from http import HTTPStatus as statuses
+
+import flask
+
+from ... import string
+from ...result import make_result
+from ...resource import ApiResource
+from ....database import schema as db
+
+
+VERSION = 1
+
+DEFAULT_TREND_DAYS = 30
+
+
+resource = ApiResource(__name__, version=VERSION)
+
+
+def get_dates_range(request):
+    date_to = request.args.get('date_to', None)
+    date_from = request.args.get('date_from', None)
+
+    if date_to is not None:
+        date_to = string.to_datetime(date_to, no_time=True).date()
+    else:
+        date_to = datetime.date.today()
+
+    if date_from is not None:
+        date_from = string.to_datetime(date_from, no_time=True).date()
+    else:
+        date_from = date_to - datetime.timedelta(days=DEFAULT_TREND_DAYS - 1)
+
+    return date_from, date_to
+
+
+@resource.route('/jobs/<string:job_name>/trend', methods=['GET'])
+def get_trend_of_job(job_name):
+    """
+    Get daily statistic of finished builds from job.
+    Days without builds are skipped.
+
+    METHOD: GET
+    PATH: /api/v1/jobs/<string:job_name>/trend
+
+    GET params
+
+        * date_from: range from date (last 30 days by default)
+        * date_to: range to date (today by default)
+    """
+    job = db.Job.get_by_name(job_name)
+
+    if job:
+        date_from, date_to = get_dates_range(flask.request)
+
+        query = db.JobDailyStat.query.filter(
+            db.JobDailyStat.job_id == job.id,
+            db.JobDailyStat.date >= date_from,
+            db.JobDailyStat.date <= date_to,
+        ).order_by(db.JobDailyStat.date)
+
+        return make_result(
+            query.all(),
+            job=job,
+            date_from=date_from,
+            date_to=date_to,
+        ), statuses.OK
+
+
+@resource.route('/jobs/<string:job_name>/cases/<string:case_name>/trend', methods=['GET'])
+def get_trend_of_case(job_name, case_name):
+    """
+    Get daily statistic of case from job.
+    Days without case results are skipped.
+
+    METHOD: GET
+    PATH: /api/v1/jobs/<string:job_name>/cases/<string:case_name>/trend
+
+    GET params
+
+        * date_from: range from date (last 30 days by default)
+        * date_to: range to date (today by default)
+    """
+    job = db.Job.get_by_name(job_name)
+
+    if job:
+        case = db.Case.get_by_name(job.id, case_name)
+
+        if case:
+            date_from, date_to = get_dates_range(flask.request)
+
+            query = db.CaseDailyStat.query.filter(
+                db.CaseDailyStat.case_id == case.id,
+                db.CaseDailyStat.date >= date_from,
+                db.CaseDailyStat.date <= date_to,
+            ).order_by(db.CaseDailyStat.date)
+
+            return make_result(
+                query.all(),
+                job=job,
+                case=case,
+                date_from=date_from,
+                date_to=date_to,
+            ), statuses.OK
@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
 
+import zlib
+import time
+import hashlib
 import logging
 from enum import Enum
+from http import HTTPStatus as statuses
 
 import flask
+from werkzeug.http import quote_etag
+from werkzeug.http import unquote_etag
 
 from .. import json
 
@@ -12,6 +18,15 @@ logger = logging.getLogger(__name__)
 
 
 DEFAULT_STATUS_CODE = 200
+DEFAULT_CACHE_MAX_AGE = 60 * 60 * 24
+
+DEFAULT_COMPRESSION_LEVEL = 6
+DEFAULT_COMPRESSION_MIN_SIZE = 1024
+DEFAULT_COMPRESSION_CHUNK_SIZE = 64 * 1024
+
+GZIP_ENCODING = 'gzip'
+GZIP_ETAG_SUFFIX = '-gzip'
+GZIP_WBITS = 16 + zlib.MAX_WBITS
 
 
 def is_status(code):
@@ -22,7 +37,93 @@ def is_status(code):
     )
 
 
+def make_etag(*stamp):
+    return hashlib.sha1(
+        ':'.join(str(v) for v in stamp).encode('utf-8'),
+    ).hexdigest()
+
+
+def cache_headers(*stamp):
+    """
+    Headers for response what is not changed while stamp is the same.
+    """
+    config = flask.current_app.config.get('API', {})
+
+    return {
+        'ETag': quote_etag(make_etag(*stamp)),
+        'Cache-Control': 'public, max-age={}'.format(
+            config.get('CACHE_MAX_AGE', DEFAULT_CACHE_MAX_AGE),
+        ),
+    }
+
+
+def get_not_modified_etag(status_code, headers):
+    """
+    Returns ETag of representation what client has if it's actual.
+    """
+    if status_code != DEFAULT_STATUS_CODE or not headers or 'ETag' not in headers:
+        return None
+
+    etag, _ = unquote_etag(headers['ETag'])
+
+    for value in (etag, etag + GZIP_ETAG_SUFFIX):
+        if flask.request.if_none_match.contains_weak(value):
+            return quote_etag(value)
+
+
+def accepts_gzip(request):
+    return request.accept_encodings[GZIP_ENCODING] > 0
+
+
+def iter_gzip(data, level, chunk_size):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    view = memoryview(data)
+
+    for offset in range(0, len(data), chunk_size):
+        chunk = compressor.compress(view[offset:offset + chunk_size])
+
+        if chunk:
+            yield chunk
+
+    yield compressor.flush()
+
+
+def compress(data, headers):
+    """
+    Compress body by gzip if client accepts it and body is large enough.
+    Large body is compressed by chunks while response is sent.
+    Returns body and headers of response.
+    """
+    config = flask.current_app.config.get('API', {})
+    min_size = config.get('COMPRESSION_MIN_SIZE', DEFAULT_COMPRESSION_MIN_SIZE)
+
+    if min_size is None or len(data) < min_size:
+        return data, headers
+
+    headers = dict(headers or {}, Vary='Accept-Encoding')
+
+    if not accepts_gzip(flask.request):
+        return data, headers
+
+    level = config.get('COMPRESSION_LEVEL', DEFAULT_COMPRESSION_LEVEL)
+    chunk_size = config.get('COMPRESSION_CHUNK_SIZE', DEFAULT_COMPRESSION_CHUNK_SIZE)
+
+    headers['Content-Encoding'] = GZIP_ENCODING
+
+    if 'ETag' in headers:
+        etag, _ = unquote_etag(headers['ETag'])
+        headers['ETag'] = quote_etag(etag + GZIP_ETAG_SUFFIX)
+
+    if len(data) <= chunk_size:
+        return b''.join(iter_gzip(data, level, chunk_size)), headers
+
+    return iter_gzip(data, level, chunk_size), headers
+
+
 def make_response(rv):
+    if isinstance(rv, flask.Response):
+        return rv
+
     status_or_headers = headers = None
 
     if isinstance(rv, tuple):
@@ -39,8 +140,21 @@ def make_response(rv):
     else:
         status_code = DEFAULT_STATUS_CODE
 
+    # body is not serialized when client has actual version
+    etag = get_not_modified_etag(status_code, headers)
+
+    if etag is not None:
+        return flask.Response(
+            headers=dict(headers, ETag=etag),
+            status=statuses.NOT_MODIFIED,
+        )
+
+    started = time.time()
+    body, headers = compress(json.dumps(rv).encode('utf-8'), headers)
+    flask.g.serialization_time = getattr(flask.g, 'serialization_time', 0.0) + time.time() - started
+
     return flask.Response(
-        json.dumps(rv),
+        body,
         headers=headers,
         status=status_code,
         mimetype=json.JSON_MIME_TYPE,
@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 
 import unittest
+from contextlib import contextmanager
+
+from sqlalchemy import event
 
 from ... import json
 from ... import wsgi
+from ...database import alchemy
 
 
 class BaseApiTestCse(unittest.TestCase):
@@ -36,6 +40,29 @@ class BaseApiTestCse(unittest.TestCase):
     def delete(self, *args, **kwargs):
         return self.app.put(*args, **kwargs)
 
+    @contextmanager
+    def assertMaxQueries(self, count):
+        """
+        Fail if more than count SQL statements were executed inside of block.
+        """
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = alchemy.alchemy.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+        self.assertLessEqual(
+            len(statements), count,
+            'Too many queries:\n{}'.format('\n'.join(statements)),
+        )
+
     @staticmethod
     def get_json(resp):
         return json.loads(resp.data.decode('utf-8'))
@@ -1,5 +1,26 @@
 # -*- coding: utf-8 -*-
 
+import io
+import os
+import gzip
+import shutil
+import datetime
+import tempfile
+
+from sqlalchemy import event
+
+from ... import json
+from ... import wsgi
+from ... import spool
+from ...database import cache
+from ...database import alchemy
+from ...database import stat
+from ...database import ingest
+from ...database import retention
+from ...database import fingerprint
+from ...database import metadata as storage
+from ...database import schema as db
+from ..resourses.v1 import cases
 from .tools import random_name
 from .base import BaseApiTestCse
 
@@ -212,3 +233,951 @@ class TestFullCycle(BaseApiTestCse):
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(len(data['result']), 1)
         self.assertIn(case_result['result'], data['result'])
+
+    def test_20_create_case_results_in_bulk(self):
+        names = [random_name() for _ in range(3)]
+        data = [
+            {
+                'name': name,
+                'runtime': 1.5,
+                'status': 'failed',
+                'reason': 'some reason',
+                'metadata': {
+                    'issue': 'http://localhost/TRG-13432',
+                },
+            }
+            for name in names
+        ]
+        path = '/api/v1/jobs/{}/builds/{}/cases'.format(
+            job['result']['name'],
+            build['result']['name'],
+        )
+
+        resp = self.post(path, data)
+        self.assertEqual(resp.status_code, 200)
+        result = self.get_json(resp)
+        self.assertEqual(result['extra']['created_count'], 0)
+        self.assertEqual(result['extra']['failed_count'], len(names))
+
+        resp = self.post('{}?autocreation=true'.format(path), data)
+        self.assertEqual(resp.status_code, 200)
+        result = self.get_json(resp)
+        self.assertEqual(result['extra']['created_count'], len(names))
+        self.assertEqual([o['name'] for o in result['result']], names)
+
+        resp = self.get('{}/{}'.format(path, names[-1]))
+        self.assertEqual(resp.status_code, 200)
+        self.assertDictEqual(self.get_json(resp)['result']['metadata'], data[-1]['metadata'])
+
+    def test_21_merge_build_metadata(self):
+        data = {
+            'was_success': True,
+            'success_count': 100,
+            'tests_count': 110,
+            'error_count': 3,
+            'fail_count': 7,
+            'runtime': 148.46,
+            'metadata': {
+                'branch': 'master',
+            },
+        }
+        resp = self.put(
+            '/api/v1/jobs/{}/builds/{}/stop'.format(
+                job['result']['name'],
+                build['result']['name'],
+            ),
+            data,
+        )
+        self.assertEqual(resp.status_code, 200)
+
+        metadata = dict(build['result']['metadata'], **data['metadata'])
+        self.assertDictEqual(self.get_json(resp)['result']['metadata'], metadata)
+
+    def test_22_get_lists_without_n_plus_one_queries(self):
+        with self.assertMaxQueries(6):
+            resp = self.get('/api/v1/jobs/{}/cases/stat'.format(job['result']['name']))
+        self.assertEqual(resp.status_code, 200)
+        self.assertGreater(len(self.get_json(resp)['result']), 1)
+
+        with self.assertMaxQueries(6):
+            resp = self.get('/api/v1/jobs/{}/builds'.format(job['result']['name']))
+        self.assertEqual(resp.status_code, 200)
+
+    def test_23_get_stat_of_cases_from_job_by_cursor(self):
+        path = '/api/v1/jobs/{}/cases/stat'.format(job['result']['name'])
+
+        resp = self.get(path)
+        self.assertEqual(resp.status_code, 200)
+        expected = self.get_json(resp)['result']
+
+        result = []
+        cursor = ''
+
+        while cursor is not None:
+            resp = self.get(path, query_string={'cursor': cursor, 'limit': 2})
+            self.assertEqual(resp.status_code, 200)
+
+            data = self.get_json(resp)
+            self.assertNotIn('total_count', data['extra'])
+            self.assertLessEqual(data['extra']['current_count'], 2)
+
+            result.extend(data['result'])
+            cursor = data['extra']['next']
+
+        self.assertEqual(result, expected)
+
+    def test_24_invalid_cursor(self):
+        resp = self.get('/api/v1/jobs/{}/builds?cursor=qwe'.format(job['result']['name']))
+        self.assertEqual(resp.status_code, 400)
+
+    def test_25_get_aggregated_stats_of_case(self):
+        resp = self.get(
+            '/api/v1/jobs/{}/cases/{}/stat?aggregate=true'.format(
+                job['result']['name'],
+                case['result']['name'],
+            ),
+        )
+        self.assertEqual(resp.status_code, 200)
+
+        summary = self.get_json(resp)['result']
+        self.assertEqual(summary['count'], 1)
+        self.assertEqual(summary['statuses']['passed'], 1)
+        self.assertEqual(summary['pass_rate'], 1.0)
+        self.assertEqual(summary['runtime']['p50'], case_result['result']['runtime'])
+
+    def test_26_get_trend_of_case(self):
+        resp = self.get(
+            '/api/v1/jobs/{}/cases/{}/trend'.format(
+                job['result']['name'],
+                case['result']['name'],
+            ),
+        )
+        self.assertEqual(resp.status_code, 200)
+
+        days = self.get_json(resp)['result']
+        self.assertEqual(len(days), 1)
+        self.assertEqual(days[0]['passed'], 1)
+        self.assertEqual(days[0]['runtime_avg'], case_result['result']['runtime'])
+
+    def test_27_get_trend_of_job(self):
+        resp = self.get('/api/v1/jobs/{}/trend'.format(job['result']['name']))
+        self.assertEqual(resp.status_code, 200)
+
+        days = self.get_json(resp)['result']
+        self.assertEqual(len(days), 1)
+        self.assertEqual(days[0]['builds_count'], 1)
+
+    def test_28_export_stat_of_cases_from_job(self):
+        path = '/api/v1/jobs/{}/cases/stat/export'.format(job['result']['name'])
+
+        resp = self.get(path)
+        self.assertEqual(resp.status_code, 200)
+        records = [json.loads(line) for line in resp.data.decode('utf-8').splitlines()]
+        self.assertIn(case['result']['name'], [r['case'] for r in records])
+
+        resp = self.get('{}?format=csv'.format(path))
+        self.assertEqual(resp.status_code, 200)
+        lines = resp.data.decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'case,build,date,status,runtime,reason')
+        self.assertEqual(len(lines), len(records) + 1)
+
+        resp = self.get('{}?format=xml'.format(path))
+        self.assertEqual(resp.status_code, 400)
+
+    def test_29_names_are_resolved_from_cache(self):
+        hits = cache.names.hits
+
+        resp = self.get('/api/v1/jobs/{}'.format(job['result']['name']))
+        self.assertEqual(resp.status_code, 200)
+        self.assertGreater(cache.names.hits, hits)
+
+    def test_30_request_body_is_too_large(self):
+        config = wsgi.app.config.setdefault('API', {})
+        max_body_size = config.get('MAX_BODY_SIZE')
+        config['MAX_BODY_SIZE'] = 10
+
+        try:
+            resp = self.post(
+                '/api/v1/jobs/{}/cases/{}'.format(job['result']['name'], random_name()),
+                {'description': 'It is a case from test'},
+            )
+        finally:
+            config['MAX_BODY_SIZE'] = max_body_size
+
+        self.assertEqual(resp.status_code, 413)
+
+    def test_31_stop_build_with_counts_from_results(self):
+        resp = self.put(
+            '/api/v1/jobs/{}/builds/{}/stop'.format(
+                job['result']['name'],
+                build['result']['name'],
+            ),
+            {'from_results': True},
+        )
+        self.assertEqual(resp.status_code, 200)
+
+        result = self.get_json(resp)['result']
+        self.assertEqual(result['tests_count'], 4)
+        self.assertEqual(result['success_count'], 1)
+        self.assertEqual(result['fail_count'], 3)
+        self.assertEqual(result['error_count'], 0)
+        self.assertEqual(result['was_success'], False)
+        self.assertAlmostEqual(result['runtime'], case_result['result']['runtime'] + 3 * 1.5)
+
+        resp = self.put(
+            '/api/v1/jobs/{}/builds/{}/stop'.format(
+                job['result']['name'],
+                build['result']['name'],
+            ),
+            {'from_results': False},
+        )
+        self.assertEqual(resp.status_code, 400)
+
+    def test_32_get_finished_build_with_etag(self):
+        path = '/api/v1/jobs/{}/builds/{}'.format(
+            job['result']['name'],
+            build['result']['name'],
+        )
+
+        resp = self.get(path)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('max-age', resp.headers['Cache-Control'])
+
+        etag = resp.headers['ETag']
+
+        resp = self.get(path, headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.headers['ETag'], etag)
+        self.assertEqual(resp.data, b'')
+
+        resp = self.get(path, headers={'If-None-Match': '"other"'})
+        self.assertEqual(resp.status_code, 200)
+
+    def test_33_response_is_compressed(self):
+        path = '/api/v1/jobs/{}/cases/stat'.format(job['result']['name'])
+        config = wsgi.app.config.setdefault('API', {})
+        min_size = config.get('COMPRESSION_MIN_SIZE')
+        config['COMPRESSION_MIN_SIZE'] = 10
+
+        try:
+            plain = self.get(path)
+            compressed = self.get(path, headers={'Accept-Encoding': 'gzip'})
+        finally:
+            config['COMPRESSION_MIN_SIZE'] = min_size
+
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(plain.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.data), plain.data)
+
+    def test_34_get_flaky_cases_from_job(self):
+        path = '/api/v1/jobs/{}/flaky'.format(job['result']['name'])
+
+        resp = self.get('{}?builds=10&limit=5'.format(path))
+        self.assertEqual(resp.status_code, 200)
+
+        result = self.get_json(resp)
+        self.assertEqual(result['extra']['builds'], 10)
+        self.assertLessEqual(len(result['result']), 5)
+
+        resp = self.get('{}?builds=0'.format(path))
+        self.assertEqual(resp.status_code, 400)
+
+        for limit in (0, -1, 10 ** 9):
+            resp = self.get('{}?limit={}'.format(path, limit))
+            self.assertEqual(resp.status_code, 400)
+
+        # case with name "flaky" is not shadowed
+        resp = self.post(
+            '/api/v1/jobs/{}/cases/flaky'.format(job['result']['name']),
+            {'description': 'Case with name of endpoint'},
+        )
+        self.assertEqual(resp.status_code, 201)
+
+        resp = self.get('/api/v1/jobs/{}/cases/flaky'.format(job['result']['name']))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.get_json(resp)['result']['name'], 'flaky')
+
+    def test_35_get_diff_of_builds(self):
+        path = '/api/v1/jobs/{}/builds/{}/diff/{}'.format(
+            job['result']['name'],
+            build['result']['name'],
+            build['result']['name'],
+        )
+
+        resp = self.get('{}?category=still_failing'.format(path))
+        self.assertEqual(resp.status_code, 200)
+
+        result = self.get_json(resp)
+        self.assertEqual(result['extra']['counts']['still_failing'], 3)
+        self.assertEqual(result['extra']['counts']['new_failures'], 0)
+        self.assertEqual(result['extra']['counts']['added'], 0)
+        self.assertEqual(result['extra']['counts']['removed'], 0)
+        self.assertEqual(len(result['result']), 3)
+
+        resp = self.get('{}?category=unknown'.format(path))
+        self.assertEqual(resp.status_code, 400)
+
+    def test_36_server_timing(self):
+        resp = self.get('/api/v1/jobs/{}'.format(job['result']['name']))
+        self.assertEqual(resp.status_code, 200)
+
+        timing = resp.headers['Server-Timing']
+
+        for name in ('db', 'validate', 'serialize', 'total'):
+            self.assertIn('{};dur='.format(name), timing)
+
+    def test_37_get_system_stats(self):
+        resp = self.get('/api/v1/system/stats')
+        self.assertEqual(resp.status_code, 200)
+
+        result = self.get_json(resp)['result']
+        self.assertGreater(result['database_pool']['checkouts'], 0)
+        self.assertIn('hits', result['name_cache'])
+
+    def test_38_consistent_read(self):
+        path = '/api/v1/jobs/{}'.format(job['result']['name'])
+
+        resp = self.get('{}?consistent=true'.format(path))
+        self.assertEqual(resp.status_code, 200)
+
+        resp = self.get(path, headers={'X-Consistent-Read': 'true'})
+        self.assertEqual(resp.status_code, 200)
+
+        resp = self.get('/api/v1/system/stats')
+        self.assertEqual(self.get_json(resp)['result']['replica_pools'], [])
+
+    def test_39_filter_by_metadata(self):
+        path = '/api/v1/jobs/{}/builds'.format(job['result']['name'])
+
+        resp = self.get('{}?md.branch=master'.format(path))
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(build['result']['name'], [b['name'] for b in self.get_json(resp)['result']])
+
+        resp = self.get('{}?md.branch=master&md.issue=unknown'.format(path))
+        self.assertEqual(self.get_json(resp)['result'], [])
+
+        resp = self.get(
+            '/api/v1/jobs/{}/cases/stat?md.issue={}'.format(
+                job['result']['name'], case_result['result']['metadata']['issue'],
+            ),
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertGreater(len(self.get_json(resp)['result']), 0)
+
+    def test_40_get_failures_from_job(self):
+        resp = self.get(
+            '/api/v1/jobs/{}/failures?build={}&samples=2'.format(
+                job['result']['name'],
+                build['result']['name'],
+            ),
+        )
+        self.assertEqual(resp.status_code, 200)
+
+        groups = self.get_json(resp)['result']
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(groups[0]['count'], 3)
+        self.assertEqual(groups[0]['reason'], 'some reason')
+        self.assertEqual(len(groups[0]['cases']), 2)
+
+        resp = self.get('/api/v1/jobs/{}/failures'.format(job['result']['name']))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.get_json(resp)['result'][0]['count'], 3)
+
+    def test_41_metadata_of_bulk_case_results_is_not_mixed(self):
+        name = random_name()
+        data = [
+            {'name': name, 'runtime': 1.0, 'status': 'passed', 'metadata': {'n': '1'}},
+            {'name': name, 'runtime': 2.0, 'status': 'passed'},
+            {'name': name, 'runtime': 3.0, 'status': 'passed', 'metadata': {'n': '3'}},
+        ]
+        path = '/api/v1/jobs/{}/builds/{}/cases?autocreation=true'.format(
+            job['result']['name'],
+            build['result']['name'],
+        )
+
+        resp = self.post(path, data)
+        self.assertEqual(resp.status_code, 200)
+
+        # the second batch of the same case must not take metadata of the first one
+        resp = self.post(path, [{'name': name, 'runtime': 4.0, 'status': 'passed', 'metadata': {'n': '4'}}])
+        self.assertEqual(resp.status_code, 200)
+
+        resp = self.get('/api/v1/jobs/{}/cases/{}/stat'.format(job['result']['name'], name))
+        self.assertEqual(resp.status_code, 200)
+
+        metadata = dict((r['runtime'], r['metadata']) for r in self.get_json(resp)['result'])
+        self.assertDictEqual(metadata, {
+            1.0: {'n': '1'},
+            2.0: {},
+            3.0: {'n': '3'},
+            4.0: {'n': '4'},
+        })
+
+    def test_42_invalid_limit_of_page(self):
+        path = '/api/v1/jobs/{}/builds?cursor='.format(job['result']['name'])
+
+        for limit in (0, -5, 1001, 'many'):
+            resp = self.get('{}&limit={}'.format(path, limit))
+            self.assertEqual(resp.status_code, 400, limit)
+
+        resp = self.get('{}&limit=1'.format(path))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(self.get_json(resp)['result']), 1)
+
+    def test_43_export_reads_records_by_chunks(self):
+        path = '/api/v1/jobs/{}/cases/stat/export'.format(job['result']['name'])
+
+        resp = self.get(path)
+        self.assertEqual(resp.status_code, 200)
+        expected = resp.data.decode('utf-8').splitlines()
+        self.assertGreater(len(expected), 2)
+
+        chunk_size = cases.EXPORT_CHUNK_SIZE
+        cases.EXPORT_CHUNK_SIZE = 2
+
+        try:
+            with self.assertMaxQueries(len(expected) // 2 + 10) as statements:
+                resp = self.get(path)
+                self.assertEqual(resp.status_code, 200)
+                lines = resp.data.decode('utf-8').splitlines()
+        finally:
+            cases.EXPORT_CHUNK_SIZE = chunk_size
+
+        self.assertEqual(lines, expected)
+        self.assertGreater(len([s for s in statements if 'LIMIT' in s]), len(expected) // 2)
+
+    def test_44_chunked_request_body_is_too_large(self):
+        config = wsgi.app.config.setdefault('API', {})
+        max_body_size = config.get('MAX_BODY_SIZE')
+        config['MAX_BODY_SIZE'] = 10
+        path = '/api/v1/jobs/{}/cases/{}'.format(job['result']['name'], random_name())
+        body = json.dumps({'description': 'It is a case from test'}).encode('utf-8')
+        chunked = {'CONTENT_LENGTH': '', 'wsgi.input_terminated': True}
+
+        try:
+            resp = self.app.post(
+                path,
+                input_stream=io.BytesIO(body),
+                content_type='application/json',
+                headers={'Transfer-Encoding': 'chunked'},
+                environ_overrides=chunked,
+            )
+        finally:
+            config['MAX_BODY_SIZE'] = max_body_size
+
+        self.assertEqual(resp.status_code, 413)
+
+        resp = self.app.post(
+            path,
+            input_stream=io.BytesIO(body),
+            content_type='application/json',
+            headers={'Transfer-Encoding': 'chunked'},
+            environ_overrides=chunked,
+        )
+        self.assertEqual(resp.status_code, 201)
+
+        # body of unknown length is empty when server doesn't dechunk it
+        resp = self.app.post(
+            path,
+            input_stream=io.BytesIO(body),
+            content_type='application/json',
+            headers={'Transfer-Encoding': 'chunked'},
+            environ_overrides={'CONTENT_LENGTH': ''},
+        )
+        self.assertEqual(resp.status_code, 400)
+
+    def test_45_spool_replays_complete_records(self):
+        directory = tempfile.mkdtemp()
+        build_name = random_name()
+        case_name = random_name()
+
+        def case_result_record(runtime):
+            return spool.make_case_result_record(
+                job['result']['name'], build_name, case_name,
+                {'status': 'passed', 'runtime': runtime},
+                autocreation=True,
+            )
+
+        def get_runtimes():
+            resp = self.get('/api/v1/jobs/{}/cases/{}/stat?cursor='.format(job['result']['name'], case_name))
+            self.assertEqual(resp.status_code, 200)
+            return [r['runtime'] for r in self.get_json(resp)['result']]
+
+        try:
+            current = spool.Spool(os.path.join(directory, 'test.spool'), fsync=False)
+            # build record goes before its case results
+            current.append(spool.make_build_record(job['result']['name'], build_name, None))
+            current.append(case_result_record(1.0))
+            current.append(case_result_record(2.0))
+            complete = current.size()
+
+            line = json.dumps(case_result_record(3.0)).encode('utf-8') + b'\n'
+
+            with open(current.path, 'ab') as fp:
+                fp.write(line[:20])
+
+            with wsgi.app.app_context():
+                spool.flush(current)
+
+            self.assertEqual(current.get_offset(), complete)
+            self.assertEqual(get_runtimes(), [2.0, 1.0])
+
+            with open(current.path, 'ab') as fp:
+                fp.write(line[20:])
+
+            with wsgi.app.app_context():
+                spool.flush(current)
+
+            self.assertEqual(current.get_offset(), 0)
+            self.assertEqual(current.size(), 0)
+            self.assertEqual(get_runtimes(), [3.0, 2.0, 1.0])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_46_spool_postpones_case_results_of_unknown_build(self):
+        directory = tempfile.mkdtemp()
+        build_name = random_name()
+        case_name = random_name()
+
+        try:
+            first = spool.Spool(os.path.join(directory, 'first.spool'), fsync=False)
+            second = spool.Spool(os.path.join(directory, 'second.spool'), fsync=False)
+
+            # build is in spool of another process yet
+            first.append(spool.make_case_result_record(
+                job['result']['name'], build_name, case_name,
+                {'status': 'passed', 'runtime': 1.0},
+                autocreation=True,
+            ))
+            second.append(spool.make_build_record(job['result']['name'], build_name, None))
+            size = first.size()
+
+            with wsgi.app.app_context():
+                spool.flush(first)
+
+            self.assertEqual(first.get_offset(), size)
+            self.assertEqual(first.size(), size * 2)
+
+            with wsgi.app.app_context():
+                spool.flush(second)
+                spool.flush(first)
+
+            self.assertEqual(first.get_offset(), 0)
+            self.assertEqual(first.size(), 0)
+
+            resp = self.get('/api/v1/jobs/{}/cases/{}/stat'.format(job['result']['name'], case_name))
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(len(self.get_json(resp)['result']), 1)
+
+            # too old case results of unknown build are dropped
+            record = spool.make_case_result_record(
+                job['result']['name'], random_name(), case_name,
+                {'status': 'passed', 'runtime': 1.0},
+            )
+            record['date'] = spool.dump_date(
+                datetime.datetime.now() - datetime.timedelta(seconds=spool.DEFAULT_ORPHAN_TIMEOUT + 1),
+            )
+            first.append(record)
+
+            with wsgi.app.app_context():
+                spool.flush(first)
+
+            self.assertEqual(first.size(), 0)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_47_spool_is_flushed_before_read_and_stop_of_build(self):
+        directory = tempfile.mkdtemp()
+        build_name = random_name()
+        spool.current = spool.Spool(os.path.join(directory, 'test.spool'), fsync=False)
+
+        try:
+            resp = self.post('/api/v1/jobs/{}/builds/{}/start'.format(job['result']['name'], build_name), {})
+            self.assertEqual(resp.status_code, 202)
+
+            resp = self.get('/api/v1/jobs/{}/builds/{}'.format(job['result']['name'], build_name))
+            self.assertEqual(resp.status_code, 200)
+
+            resp = self.post(
+                '/api/v1/jobs/{}/builds/{}/cases/{}?autocreation=true'.format(
+                    job['result']['name'], build_name, random_name(),
+                ),
+                {'status': 'failed', 'runtime': 1.5},
+            )
+            self.assertEqual(resp.status_code, 202)
+
+            resp = self.put(
+                '/api/v1/jobs/{}/builds/{}/stop'.format(job['result']['name'], build_name),
+                {'from_results': True},
+            )
+            self.assertEqual(resp.status_code, 200)
+
+            result = self.get_json(resp)['result']
+            self.assertEqual(result['tests_count'], 1)
+            self.assertEqual(result['fail_count'], 1)
+        finally:
+            spool.current.close()
+            spool.current = None
+            shutil.rmtree(directory)
+
+    def test_48_etag_is_changed_by_metadata(self):
+        path = '/api/v1/jobs/{}/builds/{}'.format(
+            job['result']['name'],
+            build['result']['name'],
+        )
+
+        resp = self.get(path)
+        self.assertEqual(resp.status_code, 200)
+        etag = resp.headers['ETag']
+
+        resp = self.put(
+            '{}/stop'.format(path),
+            {'from_results': True, 'metadata': {'branch': random_name()}},
+        )
+        self.assertEqual(resp.status_code, 200)
+
+        resp = self.get(path, headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+
+    def test_49_archive_case_results_older_than_cutoff(self):
+        name = random_name()
+        data = [
+            {'name': name, 'runtime': 1.0, 'status': 'passed', 'metadata': {'n': '1'}},
+            {'name': name, 'runtime': 2.0, 'status': 'failed', 'reason': 'It is a reason'},
+            {'name': name, 'runtime': 3.0, 'status': 'passed'},
+        ]
+        resp = self.post(
+            '/api/v1/jobs/{}/builds/{}/cases?autocreation=true'.format(
+                job['result']['name'],
+                build['result']['name'],
+            ),
+            data,
+        )
+        self.assertEqual(resp.status_code, 200)
+
+        cutoff = datetime.datetime(1990, 1, 2)
+        directory = tempfile.mkdtemp()
+
+        try:
+            with wsgi.app.app_context():
+                case_id = db.Case.get_by_name(db.Job.get_by_name(job['result']['name']).id, name).id
+                results = db.CaseResult.query.filter_by(case_id=case_id).order_by(db.CaseResult.runtime).all()
+                ids = [r.id for r in results]
+
+                # the last one is newer than cutoff
+                for case_result, days in zip(results, (-1, -1, 1)):
+                    case_result.date = cutoff + datetime.timedelta(days=days)
+
+                alchemy.alchemy.session.commit()
+
+                path, count = retention.archive(
+                    (datetime.date.today() - cutoff.date()).days,
+                    directory=directory,
+                    chunk_size=1,
+                    pause=0,
+                )
+
+                self.assertEqual(count, 2)
+                self.assertEqual(
+                    [r.id for r in db.CaseResult.query.filter(db.CaseResult.id.in_(ids))],
+                    ids[2:],
+                )
+                self.assertEqual(
+                    db.CaseResultMetadata.query.filter(db.CaseResultMetadata.case_result_id.in_(ids)).count(),
+                    0,
+                )
+
+            with gzip.open(path, 'rb') as fp:
+                records = sorted(
+                    (json.loads(line.decode('utf-8')) for line in fp),
+                    key=lambda r: r['id'],
+                )
+        finally:
+            shutil.rmtree(directory)
+
+        date = (cutoff - datetime.timedelta(days=1)).isoformat()
+
+        for record in records:
+            record.pop('job_id')
+
+        self.assertEqual(records, [
+            {
+                'id': ids[0], 'case': name, 'build': build['result']['name'], 'date': date,
+                'status': 'passed', 'runtime': 1.0, 'reason': '', 'metadata': {'n': '1'},
+            },
+            {
+                'id': ids[1], 'case': name, 'build': build['result']['name'], 'date': date,
+                'status': 'failed', 'runtime': 2.0, 'reason': 'It is a reason', 'metadata': {},
+            },
+        ])
+
+    def test_50_reads_are_routed_to_replica(self):
+        config = wsgi.app.config['DATABASE']
+        uris = config.get('REPLICAS')
+        config['REPLICAS'] = [str(alchemy.alchemy.engine.url)]
+        alchemy.replicas.setup(alchemy.alchemy, wsgi.app)
+
+        primary = alchemy.alchemy.engine
+        replica = alchemy.replicas.engines[0]
+        statements = {primary: [], replica: []}
+
+        def listener(engine):
+            def before_cursor_execute(conn, cursor, statement, *args):
+                statements[engine].append(statement)
+            return before_cursor_execute
+
+        listeners = dict((engine, listener(engine)) for engine in statements)
+
+        for engine, f in listeners.items():
+            event.listen(engine, 'before_cursor_execute', f)
+
+        def count_statements(*args, **kwargs):
+            for engine_statements in statements.values():
+                del engine_statements[:]
+
+            resp = self.app.open(*args, **kwargs)
+            self.assertLess(resp.status_code, 300)
+
+            return len(statements[primary]), len(statements[replica])
+
+        path = '/api/v1/jobs/{}'.format(job['result']['name'])
+
+        try:
+            on_primary, on_replica = count_statements(path)
+            self.assertEqual(on_primary, 0)
+            self.assertGreater(on_replica, 0)
+
+            on_primary, on_replica = count_statements('{}?consistent=true'.format(path))
+            self.assertGreater(on_primary, 0)
+            self.assertEqual(on_replica, 0)
+
+            on_primary, on_replica = count_statements(
+                '{}/cases/{}'.format(path, random_name()),
+                method='POST',
+                data=json.dumps({'description': 'It is a case from test'}),
+                content_type='application/json',
+            )
+            self.assertGreater(on_primary, 0)
+            self.assertEqual(on_replica, 0)
+        finally:
+            for engine, f in listeners.items():
+                event.remove(engine, 'before_cursor_execute', f)
+
+            replica.dispose()
+            alchemy.replicas.engines.remove(replica)
+            config['REPLICAS'] = uris
+
+    def test_51_document_storage_of_metadata(self):
+        mode, keys = storage.storage, storage.indexed_keys
+        storage.set_storage(storage.DOCUMENT_STORAGE)
+        storage.set_indexed_keys(['branch'])
+
+        build_name = random_name()
+        branch = random_name()
+        path = '/api/v1/jobs/{}/builds'.format(job['result']['name'])
+
+        try:
+            resp = self.post(
+                '{}/{}/start'.format(path, build_name),
+                {'metadata': {'branch': branch, 'commit': 'abc'}},
+            )
+            self.assertEqual(resp.status_code, 201)
+
+            resp = self.put(
+                '{}/{}/stop'.format(path, build_name),
+                {'from_results': True, 'metadata': {'commit': 'def'}},
+            )
+            self.assertEqual(resp.status_code, 200)
+
+            metadata = {'branch': branch, 'commit': 'def'}
+
+            resp = self.get('{}/{}'.format(path, build_name))
+            self.assertEqual(resp.status_code, 200)
+            self.assertDictEqual(self.get_json(resp)['result']['metadata'], metadata)
+
+            with wsgi.app.app_context():
+                instance = db.Build.get_by_name(db.Job.get_by_name(job['result']['name']).id, build_name)
+                self.assertDictEqual(storage.loads(instance.md_document), metadata)
+
+                # only indexed keys are written to rows
+                rows = db.BuildMetadata.query.filter_by(build_id=instance.id)
+                self.assertEqual([(r.key, r.value) for r in rows], [('branch', branch)])
+
+            resp = self.get('{}?md.branch={}'.format(path, branch))
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual([b['name'] for b in self.get_json(resp)['result']], [build_name])
+
+            resp = self.get('{}?md.commit=def'.format(path))
+            self.assertEqual(resp.status_code, 400)
+        finally:
+            storage.set_storage(mode)
+            storage.set_indexed_keys(keys)
+
+    def test_52_convert_metadata_to_documents(self):
+        mode, keys = storage.storage, storage.indexed_keys
+        storage.set_indexed_keys(['branch'])
+
+        build_name = random_name()
+        document_build_name = random_name()
+        metadata = {'branch': random_name(), 'commit': 'abc'}
+        path = '/api/v1/jobs/{}/builds'.format(job['result']['name'])
+
+        try:
+            resp = self.post('{}/{}/start'.format(path, build_name), {'metadata': metadata})
+            self.assertEqual(resp.status_code, 201)
+
+            # build what is written in document mode already
+            storage.set_storage(storage.DOCUMENT_STORAGE)
+            resp = self.post('{}/{}/start'.format(path, document_build_name), {'metadata': metadata})
+            self.assertEqual(resp.status_code, 201)
+            storage.set_storage(mode)
+
+            with wsgi.app.app_context():
+                job_id = db.Job.get_by_name(job['result']['name']).id
+                build_id = db.Build.get_by_name(job_id, build_name).id
+                document_build_id = db.Build.get_by_name(job_id, document_build_name).id
+
+                count = storage.convert_to_documents(db.Build, chunk_size=1)
+                self.assertEqual(count, db.Build.query.count())
+
+                for instance in db.Build.query.filter(db.Build.id.in_([build_id, document_build_id])):
+                    self.assertDictEqual(storage.loads(instance.md_document), metadata)
+
+                self.assertEqual(db.BuildMetadata.query.filter_by(build_id=build_id).count(), 2)
+
+                storage.convert_to_documents(db.Build, delete_rows=True)
+
+                # rows of indexed keys are kept for filters
+                rows = db.BuildMetadata.query.filter_by(build_id=build_id)
+                self.assertEqual([(r.key, r.value) for r in rows], [('branch', metadata['branch'])])
+
+            storage.set_storage(storage.DOCUMENT_STORAGE)
+
+            resp = self.get('{}/{}'.format(path, build_name))
+            self.assertEqual(resp.status_code, 200)
+            self.assertDictEqual(self.get_json(resp)['result']['metadata'], metadata)
+
+            resp = self.get('{}?md.branch={}'.format(path, metadata['branch']))
+            self.assertEqual(
+                sorted(b['name'] for b in self.get_json(resp)['result']),
+                sorted([build_name, document_build_name]),
+            )
+        finally:
+            storage.set_storage(mode)
+            storage.set_indexed_keys(keys)
+
+    def test_53_failure_groups_without_n_plus_one_queries(self):
+        build_name = random_name()
+        path = '/api/v1/jobs/{}/builds/{}'.format(job['result']['name'], build_name)
+
+        resp = self.post('{}/start'.format(path), {})
+        self.assertEqual(resp.status_code, 201)
+
+        data = [
+            {'name': random_name(), 'runtime': 1.0, 'status': 'failed', 'reason': 'reason {}'.format(i % 3)}
+            for i in range(9)
+        ]
+        resp = self.post('{}/cases?autocreation=true'.format(path), data)
+        self.assertEqual(resp.status_code, 200)
+
+        path = '/api/v1/jobs/{}/failures?build={}'.format(job['result']['name'], build_name)
+        counts = []
+
+        for limit in (1, 3):
+            with self.assertMaxQueries(10) as statements:
+                resp = self.get('{}&limit={}&samples=2'.format(path, limit))
+                self.assertEqual(resp.status_code, 200)
+
+            groups = self.get_json(resp)['result']
+            self.assertEqual(len(groups), limit)
+            self.assertEqual([len(g['cases']) for g in groups], [2] * limit)
+            counts.append(len(statements))
+
+        self.assertEqual(counts[0], counts[1])
+
+        for params in ('limit=0', 'limit=1001', 'samples=0', 'samples=101', 'samples=-1'):
+            resp = self.get('{}&{}'.format(path, params))
+            self.assertEqual(resp.status_code, 400, params)
+
+    def test_54_fingerprint_of_the_same_failure(self):
+        reasons = [
+            'Error 0x7f3a2c at line 12 of /tmp/pytest-1/test_a.py:12, id 1b4e28ba-2fa1-11d2-883f-0016d3cca427',
+            'Error 0x10ff00 at line 345 of /tmp/pytest-20/test_a.py:345, id 6fa459ea-ee8a-3ca4-894e-db77e160355e',
+            'Error  0xdeadbeef at line 7 of /var/tmp/x/test_a.py:7,\n id 00000000-0000-0000-0000-000000000000',
+        ]
+        fingerprints = set(fingerprint.make_fingerprint('failed', r) for r in reasons)
+        self.assertEqual(len(fingerprints), 1)
+
+        self.assertNotIn(fingerprint.make_fingerprint('failed', 'Other error at line 12'), fingerprints)
+        self.assertIsNone(fingerprint.make_fingerprint('passed', reasons[0]))
+        self.assertIsNone(fingerprint.make_fingerprint('error', ''))
+
+    def test_55_recompute_fingerprints(self):
+        name = random_name()
+        resp = self.post(
+            '/api/v1/jobs/{}/builds/{}/cases/{}?autocreation=true'.format(
+                job['result']['name'], build['result']['name'], name,
+            ),
+            {'status': 'failed', 'runtime': 1.0, 'reason': 'It is a reason'},
+        )
+        self.assertEqual(resp.status_code, 201)
+
+        with wsgi.app.app_context():
+            case_id = db.Case.get_by_name(db.Job.get_by_name(job['result']['name']).id, name).id
+            query = db.CaseResult.query.filter_by(case_id=case_id)
+            expected = query.one().fingerprint
+
+            # fingerprint of older normalization
+            query.update({'fingerprint': 'stale'}, synchronize_session=False)
+            alchemy.alchemy.session.commit()
+
+            stat.fill_fingerprints()
+            self.assertEqual(query.one().fingerprint, 'stale')
+
+            self.assertGreater(stat.fill_fingerprints(recompute=True), 0)
+            self.assertEqual(query.one().fingerprint, expected)
+
+    def test_56_slow_request_is_logged_with_statements(self):
+        config = wsgi.app.config['INSTRUMENTATION']
+        slow_request_time = config.get('SLOW_REQUEST_TIME')
+        config['SLOW_REQUEST_TIME'] = 0
+
+        try:
+            with self.assertLogs('seisma.instrumentation', level='WARNING') as logs:
+                resp = self.get('/api/v1/jobs/{}/cases/stat'.format(job['result']['name']))
+                self.assertEqual(resp.status_code, 200)
+        finally:
+            config['SLOW_REQUEST_TIME'] = slow_request_time
+
+        message = logs.output[-1]
+        self.assertIn('/cases/stat', message)
+        self.assertIn('SELECT', message)
+
+    def test_57_cached_ids_are_resolved_without_queries(self):
+        with wsgi.app.app_context():
+            job_id = db.Job.get_id_by_name(job['result']['name'])
+            build_id = db.Build.get_id_by_name(job_id, build['result']['name'])
+            self.assertEqual(build_id, db.Build.get_by_name(job_id, build['result']['name']).id)
+
+            with self.assertMaxQueries(0):
+                self.assertEqual(db.Job.get_id_by_name(job['result']['name']), job_id)
+                self.assertEqual(db.Build.get_id_by_name(job_id, build['result']['name']), build_id)
+
+    def test_58_ingest_batch_token_is_cleared(self):
+        with wsgi.app.app_context():
+            self.assertEqual(db.CaseResult.query.filter(db.CaseResult.ingest_batch.isnot(None)).count(), 0)
+
+    def test_59_concurrently_created_cases_are_skipped(self):
+        existing, name = random_name(), random_name()
+
+        with wsgi.app.app_context():
+            job_id = db.Job.get_id_by_name(job['result']['name'])
+            db.Case.create(job_id=job_id, name=existing)
+
+            ingest.create_cases(job_id, [existing, name])
+            alchemy.alchemy.session.commit()
+
+            case_ids = ingest.get_case_ids(job_id, [existing, name], locking=True)
+            self.assertEqual(sorted(case_ids), sorted([existing, name]))
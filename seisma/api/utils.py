@@ -1,20 +1,180 @@
 # -*- coding: utf-8 -*-
 
+import base64
+import datetime
+import json as _json
 from urllib.parse import quote
 
+from sqlalchemy import and_
+from sqlalchemy import or_
+from sqlalchemy import desc
+
+from . import string
+from .. import json
+from .. import exceptions
+
 
 DEFAULT_RECORDS_ON_PAGE = 100
+MAX_RECORDS_ON_PAGE = 1000
+
+METADATA_FILTER_PREFIX = 'md.'
+
+CURSOR_PARAM = 'cursor'
+CURSOR_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def dump_cursor_value(value):
+    if isinstance(value, datetime.datetime):
+        return {'datetime': value.strftime(CURSOR_DATETIME_FORMAT)}
+
+    if isinstance(value, datetime.date):
+        return {'date': value.strftime(json.DATE_FORMAT)}
+
+    return value
+
+
+def load_cursor_value(value):
+    if isinstance(value, dict) and 'datetime' in value:
+        return datetime.datetime.strptime(value['datetime'], CURSOR_DATETIME_FORMAT)
+
+    if isinstance(value, dict) and 'date' in value:
+        return datetime.datetime.strptime(value['date'], json.DATE_FORMAT).date()
+
+    return value
+
+
+def encode_cursor(values):
+    data = _json.dumps([dump_cursor_value(v) for v in values])
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, size):
+    try:
+        data = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        values = [load_cursor_value(v) for v in _json.loads(data.decode('utf-8'))]
+    except (TypeError, ValueError):
+        raise exceptions.ValidationError('Invalid cursor "{}"'.format(cursor))
+
+    if len(values) != size:
+        raise exceptions.ValidationError('Invalid cursor "{}"'.format(cursor))
+
+    return values
+
+
+def after_keys(keys, values):
+    """
+    Condition for records after values when ordering by keys descending.
+    """
+    clauses = []
+
+    for i, key in enumerate(keys):
+        equals = [k == v for k, v in zip(keys[:i], values[:i])]
+        clauses.append(and_(*equals + [key < values[i]]))
+
+    return and_(keys[0] <= values[0], or_(*clauses))
+
+
+def get_limit(request, default=DEFAULT_RECORDS_ON_PAGE, maximum=MAX_RECORDS_ON_PAGE):
+    limit = string.to_int(request.args.get('limit', default))
+
+    if not 0 < limit <= maximum:
+        raise exceptions.ValidationError(
+            'Limit should be from 1 to {}'.format(maximum),
+        )
 
+    return limit
 
-def paginated_query(query, request):
-    query.total_count = query.count()
+
+def keyset_page(query, request, keys):
+    limit = get_limit(request)
+    cursor = request.args.get(CURSOR_PARAM)
+
+    if cursor:
+        query = query.filter(after_keys(keys, decode_cursor(cursor, len(keys))))
+
+    records = query.limit(limit + 1).all()
+    next_cursor = None
+
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor([getattr(records[-1], k.key) for k in keys])
+
+    return records, {
+        'current_count': len(records),
+        'next': next_cursor,
+    }
+
+
+def iter_keyset_chunks(query, keys, size):
+    """
+    Iterate records of query ordered by keys descending.
+    Records are read by queries of size records after the last one,
+    so memory is not growing with the result even on buffered drivers.
+    """
+    values = None
+
+    while True:
+        chunk = query
+
+        if values is not None:
+            chunk = chunk.filter(after_keys(keys, values))
+
+        records = chunk.limit(size).all()
+
+        for record in records:
+            yield record
+
+        if len(records) < size:
+            break
+
+        values = [getattr(records[-1], k.key) for k in keys]
+
+
+def offset_page(query, request):
+    total_count = query.count()
 
     from_ = request.args.get('from', 1)
     to_ = request.args.get('to', DEFAULT_RECORDS_ON_PAGE)
 
-    query = query.slice(int(from_) - 1, int(to_))
+    records = query.slice(int(from_) - 1, int(to_)).all()
+
+    return records, {
+        'total_count': total_count,
+        'current_count': len(records),
+    }
+
+
+def paginated_query(query, request, *keys):
+    """
+    Order query by keys descending and take one page of records.
+    Returns list of records and dictionary with info about the page.
+
+    Page is taken by keyset when "cursor" param is in request,
+    empty cursor is for the first page, the next one is in "next".
+    Otherwise page is taken by "from" and "to" params.
+    """
+    query = query.order_by(*[desc(k) for k in keys])
+
+    if CURSOR_PARAM in request.args:
+        return keyset_page(query, request, keys)
+
+    return offset_page(query, request)
+
+
+def filter_by_metadata(query, model, request, is_filterable):
+    """
+    Filter query of model by "md.<key>=<value>" params of request.
+    """
+    for param, value in request.args.items(multi=True):
+        if not param.startswith(METADATA_FILTER_PREFIX):
+            continue
+
+        key = param[len(METADATA_FILTER_PREFIX):]
+
+        if not is_filterable(key):
+            raise exceptions.ValidationError('Metadata key "{}" is not indexed'.format(key))
 
-    query.current_count = query.count()
+        query = query.filter(model.md.matches(model.id, key, value))
 
     return query
 
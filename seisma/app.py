@@ -13,7 +13,12 @@ class WSGIApplication(flask.Flask):
         self.config.from_envvar(constants.CONFIG_ENV_NAME)
 
         self.init_logging()
+        self.init_json()
         self.init_alchemy()
+        self.init_metadata()
+        self.init_cache()
+        self.init_spool()
+        self.init_instrumentation()
 
         self.init_blueprints()
 
@@ -21,6 +26,26 @@ class WSGIApplication(flask.Flask):
         from seisma.database import alchemy
         alchemy.setup(self)
 
+    def init_json(self):
+        from seisma import json
+        json.setup(self)
+
+    def init_metadata(self):
+        from seisma.database import metadata
+        metadata.setup(self)
+
+    def init_cache(self):
+        from seisma.database import cache
+        cache.setup(self)
+
+    def init_spool(self):
+        from seisma import spool
+        spool.setup(self)
+
+    def init_instrumentation(self):
+        from seisma import instrumentation
+        instrumentation.setup(self)
+
     def init_logging(self):
         logging_settings = self.config.get('LOGGING_SETTINGS')
 
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+"""
+End-to-end load benchmark on synthetic data.
+Writers ingest builds with case results while readers query finished builds,
+latency of requests is reported by endpoints.
+SQLite in temporary directory is used by default, so MySQL is not required.
+
+Usage: python -m seisma.benchmarks.driver [-j JOBS] [-b BUILDS] [-c CASES] [-w WRITERS] [-r READERS]
+"""
+
+import os
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+from seisma import constants
+from seisma.benchmarks import report
+from seisma.benchmarks import generator
+
+
+DEFAULT_JOBS = 4
+DEFAULT_BUILDS = 20
+DEFAULT_CASES = 500
+DEFAULT_WRITERS = 4
+DEFAULT_READERS = 4
+DEFAULT_BATCH_SIZE = 500
+
+CONFIG_TEMPLATE = """# -*- coding: utf-8 -*-
+
+from seisma.conf.default import *
+
+
+DATABASE['URI'] = {uri!r}
+INGEST['SPOOL'] = False
+LOGGING_SETTINGS = None
+"""
+
+READS = (
+    ('GET /jobs/<job>/builds', '/api/v1/jobs/{job}/builds?cursor=&limit=100'),
+    ('GET /jobs/<job>/builds/<build>', '/api/v1/jobs/{job}/builds/{build}'),
+    ('GET /jobs/<job>/builds/<build>/cases/<case>', '/api/v1/jobs/{job}/builds/{build}/cases/{case}'),
+    ('GET /jobs/<job>/builds/<build>/diff/<other>', '/api/v1/jobs/{job}/builds/{build}/diff/{other}'),
+    ('GET /jobs/<job>/cases/stat', '/api/v1/jobs/{job}/cases/stat?cursor=&limit=100'),
+    ('GET /jobs/<job>/cases/<case>/stat', '/api/v1/jobs/{job}/cases/{case}/stat?aggregate=true'),
+    ('GET /jobs/<job>/flaky', '/api/v1/jobs/{job}/flaky?builds=50'),
+    ('GET /jobs/<job>/trend', '/api/v1/jobs/{job}/trend'),
+)
+
+
+class Client(object):
+    """
+    Test client what records latency of every request.
+    """
+
+    def __init__(self, app, recorder):
+        from seisma import json
+
+        self.json = json
+        self.client = app.test_client()
+        self.recorder = recorder
+
+    def request(self, endpoint, method, path, data=None):
+        started = time.time()
+
+        resp = self.client.open(
+            path,
+            method=method,
+            data=self.json.dumps(data) if data is not None else None,
+            content_type='application/json',
+        )
+
+        self.recorder.add(endpoint, time.time() - started, resp.status_code)
+
+        return resp
+
+
+def write(app, dataset, recorder, job_names, finished, batch_size):
+    client = Client(app, recorder)
+
+    for job_name in job_names:
+        for build_name in dataset.build_names():
+            client.request(
+                'POST /jobs/<job>/builds/<build>/start', 'POST',
+                '/api/v1/jobs/{}/builds/{}/start?autocreation=true'.format(job_name, build_name),
+                {'metadata': dataset.build_metadata(job_name, build_name)},
+            )
+
+            results = dataset.case_results(job_name, build_name)
+
+            for offset in range(0, len(results), batch_size):
+                client.request(
+                    'POST /jobs/<job>/builds/<build>/cases', 'POST',
+                    '/api/v1/jobs/{}/builds/{}/cases?autocreation=true'.format(job_name, build_name),
+                    results[offset:offset + batch_size],
+                )
+
+            client.request(
+                'PUT /jobs/<job>/builds/<build>/stop', 'PUT',
+                '/api/v1/jobs/{}/builds/{}/stop'.format(job_name, build_name),
+                {'from_results': True},
+            )
+
+            finished.append((job_name, build_name))
+
+
+def read(app, dataset, recorder, finished, stopped, seed):
+    client = Client(app, recorder)
+    rnd = random.Random(seed)
+    case_names = dataset.case_names()
+
+    while not stopped.is_set():
+        if not finished:
+            time.sleep(0.01)
+            continue
+
+        job_name, build_name = rnd.choice(finished)
+        other_build_name = rnd.choice([b for j, b in finished if j == job_name])
+        endpoint, path = rnd.choice(READS)
+
+        client.request(endpoint, 'GET', path.format(
+            job=job_name,
+            build=build_name,
+            other=other_build_name,
+            case=rnd.choice(case_names),
+        ))
+
+
+def setup_app(uri):
+    fd, path = tempfile.mkstemp(suffix='.py', prefix='seisma-benchmark-')
+
+    with os.fdopen(fd, 'w') as fp:
+        fp.write(CONFIG_TEMPLATE.format(uri=uri))
+
+    os.environ[constants.CONFIG_ENV_NAME] = path
+
+    from seisma import wsgi
+    from seisma.database.alchemy import alchemy
+
+    with wsgi.app.app_context():
+        alchemy.create_all()
+
+    return wsgi.app
+
+
+def run(dataset, uri, writers, readers, batch_size):
+    app = setup_app(uri)
+    recorder = report.Recorder()
+
+    finished = []
+    stopped = threading.Event()
+    job_names = dataset.job_names()
+
+    writer_threads = [
+        threading.Thread(
+            target=write,
+            args=(app, dataset, recorder, job_names[i::writers], finished, batch_size),
+        )
+        for i in range(writers)
+    ]
+    reader_threads = [
+        threading.Thread(
+            target=read,
+            args=(app, dataset, recorder, finished, stopped, dataset.seed + i),
+        )
+        for i in range(readers)
+    ]
+
+    started = time.time()
+
+    for thread in writer_threads + reader_threads:
+        thread.start()
+
+    for thread in writer_threads:
+        thread.join()
+
+    stopped.set()
+
+    for thread in reader_threads:
+        thread.join()
+
+    wall_time = time.time() - started
+
+    print(dataset)
+    print('{} writers, {} readers, {:.1f} s'.format(writers, readers, wall_time))
+    print(report.format_summary(recorder.summary(wall_time)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-j', '--jobs', type=int, default=DEFAULT_JOBS)
+    parser.add_argument('-b', '--builds', type=int, default=DEFAULT_BUILDS)
+    parser.add_argument('-c', '--cases', type=int, default=DEFAULT_CASES)
+    parser.add_argument('-w', '--writers', type=int, default=DEFAULT_WRITERS)
+    parser.add_argument('-r', '--readers', type=int, default=DEFAULT_READERS)
+    parser.add_argument('-s', '--seed', type=int, default=generator.DEFAULT_SEED)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument(
+        '--database', default=None,
+        help='database URI, new SQLite database in temporary directory by default',
+    )
+
+    args = parser.parse_args()
+
+    uri = args.database or 'sqlite:///{}'.format(
+        os.path.join(tempfile.mkdtemp(prefix='seisma-benchmark-'), 'seisma.db'),
+    )
+
+    run(
+        generator.Dataset(args.jobs, args.builds, args.cases, seed=args.seed),
+        uri, args.writers, args.readers, args.batch_size,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""
+Deterministic generator of synthetic data:
+jobs x builds x cases x case results with metadata.
+The same seed gives the same data.
+"""
+
+import random
+
+
+DEFAULT_SEED = 0
+
+STATUSES = ('passed', 'skipped', 'failed', 'error')
+STATUS_WEIGHTS = (85, 5, 8, 2)
+
+BROWSERS = ('firefox', 'chrome', 'safari')
+BRANCHES = ('master', 'develop', 'release')
+
+REASON = 'Traceback (most recent call last):\n  File "test_{}.py", line {}\nAssertionError\n'
+
+
+class Dataset(object):
+
+    def __init__(self, jobs, builds, cases, seed=DEFAULT_SEED):
+        self.jobs = jobs
+        self.builds = builds
+        self.cases = cases
+        self.seed = seed
+
+    def __repr__(self):
+        return '<Dataset: {} jobs x {} builds x {} cases, seed {}>'.format(
+            self.jobs, self.builds, self.cases, self.seed,
+        )
+
+    def random(self, *key):
+        return random.Random('{}:{}'.format(self.seed, ':'.join(str(k) for k in key)))
+
+    def job_names(self):
+        return ['job_{}'.format(i) for i in range(self.jobs)]
+
+    def build_names(self):
+        return ['build_{}'.format(i) for i in range(self.builds)]
+
+    def case_names(self):
+        return ['test_case_{}'.format(i) for i in range(self.cases)]
+
+    def build_metadata(self, job_name, build_name):
+        rnd = self.random(job_name, build_name)
+
+        return {
+            'branch': rnd.choice(BRANCHES),
+            'commit': '{:040x}'.format(rnd.getrandbits(160)),
+        }
+
+    def case_results(self, job_name, build_name):
+        """
+        Case results of build, every case has its own failure probability,
+        so some cases are stable and some are flaky.
+        """
+        rnd = self.random(job_name, build_name, 'results')
+        results = []
+
+        for i, name in enumerate(self.case_names()):
+            weights = STATUS_WEIGHTS if self.random(job_name, name).random() < 0.2 else (100, 0, 0, 0)
+            status = rnd.choices(STATUSES, weights)[0]
+
+            results.append({
+                'name': name,
+                'status': status,
+                'runtime': round(rnd.expovariate(1.0), 3),
+                'reason': REASON.format(i, rnd.randint(1, 500)) if status in ('failed', 'error') else '',
+                'metadata': {
+                    'browser': rnd.choice(BROWSERS),
+                },
+            })
+
+        return results
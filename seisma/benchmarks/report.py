@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import math
+import threading
+from collections import defaultdict
+
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, percent):
+    """
+    Value by nearest-rank method in sorted values.
+    """
+    return values[max(int(math.ceil(len(values) * percent / 100.0)) - 1, 0)]
+
+
+class Recorder(object):
+    """
+    Thread safe recorder of latency of requests by endpoints.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency = defaultdict(list)
+        self._errors = defaultdict(int)
+
+    def add(self, endpoint, seconds, status_code):
+        with self._lock:
+            self._latency[endpoint].append(seconds)
+
+            if status_code >= 400:
+                self._errors[endpoint] += 1
+
+    def summary(self, wall_time):
+        rows = []
+
+        for endpoint in sorted(self._latency):
+            latency = sorted(self._latency[endpoint])
+
+            row = {
+                'endpoint': endpoint,
+                'count': len(latency),
+                'errors': self._errors[endpoint],
+                'rps': len(latency) / wall_time if wall_time else 0.0,
+            }
+
+            for percent in PERCENTILES:
+                row['p{}'.format(percent)] = percentile(latency, percent) * 1000
+
+            rows.append(row)
+
+        return rows
+
+
+def format_summary(rows):
+    lines = [
+        '{:<48} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9}'.format(
+            'endpoint', 'count', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms',
+        ),
+    ]
+
+    for row in rows:
+        lines.append(
+            '{endpoint:<48} {count:>8} {errors:>7} {rps:>9.1f} {p50:>9.2f} {p95:>9.2f} {p99:>9.2f}'.format(**row),
+        )
+
+    return '\n'.join(lines)
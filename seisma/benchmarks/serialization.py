@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmark of response encoding for a page of case results.
+
+Usage: python -m seisma.benchmarks.serialization [-n NUMBER] [-s PAGE_SIZE]
+"""
+
+import timeit
+import argparse
+import datetime
+
+from seisma import json
+from seisma.api.result import make_result
+from seisma.database.alchemy import ModelMixin
+
+
+DEFAULT_NUMBER = 200
+DEFAULT_PAGE_SIZE = 100
+
+
+class Case(ModelMixin):
+
+    to_dict = json.ObjectConverter(
+        json.ObjectConverter.FromAttribute('name'),
+        json.ObjectConverter.FromAttribute('created'),
+        json.ObjectConverter.FromAttribute('description'),
+    )
+
+    def __init__(self, name):
+        self.name = name
+        self.created = datetime.date.today()
+        self.description = 'Description of {}'.format(name)
+
+
+class CaseResult(ModelMixin):
+    """
+    Has the same rules of conversion as seisma.database.schema.CaseResult,
+    so database is not required to run the benchmark.
+    """
+
+    to_dict = json.ObjectConverter(
+        json.ObjectConverter.FromAttribute('date'),
+        json.ObjectConverter.FromAttribute('reason'),
+        json.ObjectConverter.FromAttribute('status'),
+        json.ObjectConverter.FromAttribute('case'),
+        json.ObjectConverter.FromAttribute('runtime'),
+        json.ObjectConverter.FromAttribute('md', alias='metadata'),
+    )
+
+    def __init__(self, number):
+        self.date = datetime.datetime.now()
+        self.reason = 'Traceback (most recent call last):\n' * 5
+        self.status = 'failed' if number % 10 == 0 else 'passed'
+        self.case = Case('test_case_{}'.format(number))
+        self.runtime = number / 10.0
+        self.md = {
+            'browser': 'firefox',
+            'issue': 'http://localhost/TRG-{}'.format(number),
+        }
+
+
+def make_page(size):
+    return make_result(
+        [CaseResult(i) for i in range(size)],
+        total_count=size,
+        current_count=size,
+    )
+
+
+def run(number, page_size):
+    page = make_page(page_size)
+
+    for backend in sorted(json.BACKENDS):
+        try:
+            json.set_backend(backend)
+        except RuntimeError as error:
+            print('{:<12} skipped: {}'.format(backend, error))
+            continue
+
+        seconds = min(timeit.repeat(lambda: json.dumps(page), number=number, repeat=3))
+
+        print('{:<12} {:>8.3f} ms per page {:>10.0f} pages/s'.format(
+            backend, seconds / number * 1000, number / seconds,
+        ))
+
+    json.set_backend(json.DEFAULT_BACKEND)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--number', type=int, default=DEFAULT_NUMBER)
+    parser.add_argument('-s', '--page-size', type=int, default=DEFAULT_PAGE_SIZE)
+
+    args = parser.parse_args()
+
+    run(args.number, args.page_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,10 +8,16 @@ import sys
 DEBUG = False
 TESTING = False
 
+# One of (json, simplejson, orjson), orjson must be installed separately
+JSON_BACKEND = 'json'
+
 
 # Database settings
 
 DATABASE = {
+    'URI': None,  # instead of settings below, e.g. sqlite:////tmp/seisma.db
+    'DRIVER': 'mysql+mysqlconnector',  # mysql+mysqldb, postgresql+psycopg2, sqlite
+    'CREATE': True,  # create database if it does not exist
     'HOST': 'localhost',
     'PORT': 3306,
     'USER': 'root',
@@ -23,6 +29,73 @@ DATABASE = {
     'MAX_OVERFLOW': -1,
     'SQL_LOG': False,
     'TRACK_MODIFICATIONS': False,
+    # URIs of read replicas for GET endpoints, add ?consistent=true
+    # or X-Consistent-Read: true header to read from primary
+    'REPLICAS': [],
+}
+
+
+# Storage of metadata of builds and case results, one of (rows, document).
+# Run "db convert_metadata" before switching to document
+
+METADATA_STORAGE = 'rows'
+
+# Keys what are written to rows with document storage too,
+# so builds and case results can be filtered by them (md.<key>=<value>)
+
+METADATA_INDEXED_KEYS = []
+
+
+# API settings
+
+API = {
+    'MAX_BODY_SIZE': 32 * 1024 * 1024,
+    'CACHE_MAX_AGE': 60 * 60 * 24,  # for finished builds and their results
+    'COMPRESSION_MIN_SIZE': 1024,  # None to disable gzip
+    'COMPRESSION_LEVEL': 6,
+    'COMPRESSION_CHUNK_SIZE': 64 * 1024,  # larger body is compressed while it's sent
+}
+
+
+# Cache of ids of jobs, builds and cases by names
+
+NAME_CACHE = {
+    'SIZE': 10000,
+    'TTL': 60 * 5,
+}
+
+
+# Write-behind ingest, builds and case results are appended
+# to spool file and written to database by background thread
+
+INGEST = {
+    'SPOOL': False,
+    'SPOOL_DIR': None,  # ~/.seisma/spool by default
+    'FSYNC': True,
+    'FLUSH_INTERVAL': 1.0,
+    'BATCH_SIZE': 5000,
+    'ORPHAN_TIMEOUT': 60 * 10,  # seconds to wait for unknown build of case results
+}
+
+
+# Retention of raw case results, older ones are moved to archive files
+# by "db archive_case_results" command, daily rollups are kept
+
+RETENTION = {
+    'DAYS': None,  # keep forever
+    'ARCHIVE_DIR': None,  # ~/.seisma/archive by default
+    'CHUNK_SIZE': 1000,
+    'PAUSE': 0.1,  # seconds between chunks
+}
+
+# Per-request count and time of SQL statements, validation and serialization
+# in Server-Timing header and log of slow requests with the top statements
+
+INSTRUMENTATION = {
+    'ENABLED': False,
+    'SERVER_TIMING': True,
+    'SLOW_REQUEST_TIME': 1.0,  # seconds
+    'TOP_STATEMENTS': 5,
 }
 
 
@@ -8,3 +8,5 @@ TESTING = True
 
 DATABASE['NAME'] = 'seisma_test'
 DATABASE['SQL_LOG'] = False
+
+INSTRUMENTATION['ENABLED'] = True
@@ -1,11 +1,19 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import itertools
+import threading
 
+import flask
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
 from sqlalchemy.exc import InvalidRequestError
+from flask_sqlalchemy import SignallingSession
 from flask_sqlalchemy import SQLAlchemy as _SQLAlchemy
 
+from . import dialects
 from .. import exceptions
+from .pool import TimedQueuePool
 
 
 logger = logging.getLogger(__name__)
@@ -23,75 +31,158 @@ DEFAULT_POOL_RECYCLE = 60 * 5
 DEFAULT_MAX_OVERFLOW = -1
 DEFAULT_SQL_LOG = False
 DEFAULT_TRACK_MODIFICATIONS = False
+DEFAULT_CREATE = True
 
 
 alchemy = None
 session = None
 
 
-def setup_uri(app, use_db_name=True):
-    config = app.config.get('DATABASE', {})
-
-    host = config.get('HOST', DEFAULT_HOST)
-    port = config.get('PORT', DEFAULT_PORT)
+def get_uri(app):
+    return app.config['SQLALCHEMY_DATABASE_URI']
 
-    user = config.get('USER', DEFAULT_USER)
-    password = config.get('PASSWORD', DEFAULT_PASSWORD)
 
-    database = config.get('NAME', DEFAULT_DB_NAME)
+def setup_uri(app):
+    config = app.config.get('DATABASE', {})
 
-    uri = 'mysql+mysqlconnector://{user}:{password}@{host}:{port}/'.format(
-        user=user,
-        password=password,
-        host=host,
-        port=port,
-    )
+    if config.get('URI'):
+        app.config['SQLALCHEMY_DATABASE_URI'] = config['URI']
+        return
 
-    if use_db_name:
-        uri += database
-        uri += '?charset=utf8&use_unicode=1'
+    driver = config.get('DRIVER', dialects.DEFAULT_DRIVER)
 
-    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_DATABASE_URI'] = dialects.get_dialect(driver).make_uri(driver, {
+        'HOST': config.get('HOST', DEFAULT_HOST),
+        'PORT': config.get('PORT', DEFAULT_PORT),
+        'USER': config.get('USER', DEFAULT_USER),
+        'PASSWORD': config.get('PASSWORD', DEFAULT_PASSWORD),
+        'NAME': config.get('NAME', DEFAULT_DB_NAME),
+    })
 
 
 def setup_settings(app):
     config = app.config.get('DATABASE', {})
 
     app.config['SQLALCHEMY_ECHO'] = config.get('SQL_LOG', DEFAULT_SQL_LOG)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = config.get('TRACK_MODIFICATIONS', DEFAULT_TRACK_MODIFICATIONS)
+
+    if not dialects.get_dialect(get_uri(app)).pooled:
+        return
+
     app.config['SQLALCHEMY_POOL_SIZE'] = config.get('POOL_SIZE', DEFAULT_POOL_SIZE)
     app.config['SQLALCHEMY_POOL_TIMEOUT'] = config.get('POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT)
     app.config['SQLALCHEMY_POOL_RECYCLE'] = config.get('POOL_RECYCLE', DEFAULT_POOL_RECYCLE)
     app.config['SQLALCHEMY_MAX_OVERFLOW'] =config.get('MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW)
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = config.get('TRACK_MODIFICATIONS', DEFAULT_TRACK_MODIFICATIONS)
+
+
+class Replicas(object):
+    """
+    Engines of read replicas, they are taken in round-robin order.
+    """
+
+    def __init__(self):
+        self.engines = []
+
+        self._lock = threading.Lock()
+        self._cycle = None
+
+    def setup(self, sa, app):
+        for uri in app.config.get('DATABASE', {}).get('REPLICAS') or []:
+            info = make_url(uri)
+            options = {'convert_unicode': True}
+
+            sa.apply_pool_defaults(app, options)
+            sa.apply_driver_hacks(app, info, options)
+
+            self.engines.append(create_engine(info, **options))
+
+        self._cycle = itertools.cycle(self.engines)
+
+    def next(self):
+        with self._lock:
+            return next(self._cycle)
+
+
+replicas = Replicas()
+
+
+def get_replica_engine():
+    """
+    Engine of replica for request what reads only.
+    The same replica is used during request.
+    """
+    if not replicas.engines or not flask.has_request_context():
+        return None
+
+    if not getattr(flask.g, 'use_replica', False):
+        return None
+
+    engine = getattr(flask.g, 'replica_engine', None)
+
+    if engine is None:
+        engine = flask.g.replica_engine = replicas.next()
+
+    return engine
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session what reads from replica within request marked by use_replica.
+    Flush is always sent to primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        engine = None if self._flushing else get_replica_engine()
+
+        if engine is not None:
+            return engine
+
+        return super(RoutingSession, self).get_bind(mapper=mapper, clause=clause)
+
+
+class SQLAlchemy(_SQLAlchemy):
+
+    def apply_driver_hacks(self, app, info, options):
+        super(SQLAlchemy, self).apply_driver_hacks(app, info, options)
+
+        # pool of sqlite is chosen by flask-sqlalchemy
+        if dialects.get_dialect(info.drivername).pooled:
+            options.setdefault('poolclass', TimedQueuePool)
+
+    def create_session(self, options):
+        return RoutingSession(self, **options)
 
 
 def setup(app):
     global alchemy, session
 
     if alchemy is None:
-        setup_uri(app, use_db_name=False)
+        setup_uri(app)
         setup_settings(app)
 
-        alchemy = _SQLAlchemy(app)
+        alchemy = SQLAlchemy(app)
         session = alchemy.session
 
-        create_database_if_not_exists(app.config)
-        setup_uri(app, use_db_name=True)
+        replicas.setup(alchemy, app)
+
+        if app.config.get('DATABASE', {}).get('CREATE', DEFAULT_CREATE):
+            create_database_if_not_exists(app)
     else:
         raise RuntimeError('Database already initialized')
 
 
-def create_database_if_not_exists(config):
-    config = config.get('DATABASE', {})
-    db_name = config.get('NAME', DEFAULT_DB_NAME)
+def create_database_if_not_exists(app):
+    uri = get_uri(app)
+    dialects.get_dialect(uri).create_database_if_not_exists(uri)
+
+
+def get_pool_telemetry(engine=None):
+    pool = (engine or alchemy.engine).pool
 
-    conn = alchemy.engine.connect()
-    conn.execute(
-        'CREATE DATABASE IF NOT EXISTS {} '
-        'DEFAULT CHARACTER SET utf8 '
-        'DEFAULT COLLATE utf8_general_ci'.format(db_name),
-    )
-    conn.close()
+    if isinstance(pool, TimedQueuePool):
+        return pool.telemetry()
+
+    return None
 
 
 def get_connection():
@@ -105,7 +196,7 @@ class ModelMixin(object):
     }
 
     @classmethod
-    def create(cls, **params):
+    def create(cls, commit=True, **params):
         try:
             instance = cls(**params)
         except TypeError as error:
@@ -114,6 +205,11 @@ class ModelMixin(object):
             )
 
         alchemy.session.add(instance)
+
+        if not commit:
+            alchemy.session.flush()
+            return instance
+
         alchemy.session.commit()
 
         try:
@@ -123,6 +219,15 @@ class ModelMixin(object):
 
         return instance
 
+    @classmethod
+    def bulk_create(cls, rows):
+        """
+        Insert rows with one multi-row statement
+        within the current transaction (without commit).
+        """
+        if rows:
+            alchemy.session.execute(cls.__table__.insert(), rows)
+
     def update(self, **params):
         for k, v in params.items():
             setattr(self, k, v)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from collections import OrderedDict
+
+
+DEFAULT_SIZE = 10000
+DEFAULT_TTL = 60 * 5
+
+
+class LRUCache(object):
+    """
+    Thread safe cache with limited size and time to live of values.
+    The least recently used value is dropped when size is exceeded.
+    """
+
+    def __init__(self, size=DEFAULT_SIZE, ttl=DEFAULT_TTL):
+        self.size = size
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def configure(self, size=DEFAULT_SIZE, ttl=DEFAULT_TTL):
+        with self._lock:
+            self.size = size
+            self.ttl = ttl
+            self._data.clear()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+
+            if item is not None and item[1] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[0]
+
+            if item is not None:
+                del self._data[key]
+
+            self.misses += 1
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_if(self, predicate):
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'max_size': self.size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+# Keys are ('job', name), ('build', job_id, name), ('case', job_id, name)
+names = LRUCache()
+
+
+def remember_job(job):
+    names.set(('job', job.name), job.id)
+
+
+def remember_case(case):
+    names.set(('case', case.job_id, case.name), case.id)
+
+
+def invalidate_job(job):
+    names.invalidate(('job', job.name))
+    names.invalidate_if(lambda k: k[0] != 'job' and k[1] == job.id)
+
+
+def setup(app):
+    config = app.config.get('NAME_CACHE', {})
+
+    names.configure(
+        size=config.get('SIZE', DEFAULT_SIZE),
+        ttl=config.get('TTL', DEFAULT_TTL),
+    )
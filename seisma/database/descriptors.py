@@ -1,34 +1,129 @@
 # -*- coding: utf-8 -*-
 
+from . import metadata as storage
+
 
 class MetadataProperty(object):
+    """
+    Dictionary of metadata which is stored as rows of metadata model
+    or as document in column of instance, it depends on storage mode.
+    Writing does not commit, it's happening in transaction of caller.
+    Loaded metadata is kept on instance until it will be rewritten.
+    """
 
-    def __init__(self, metadata_model, fk):
-        self._fk = fk
-        self._metadata_model = metadata_model
+    def __init__(self, metadata_model, fk, document=None):
+        self.fk = fk
+        self.document = document
+        self.metadata_model = metadata_model
+        self._cache_key = '_{}_cache'.format(metadata_model.__tablename__)
 
     def __repr__(self):
         return '<MetadataProperty: {}>'.format(
-            self._metadata_model.__name__,
+            self.metadata_model.__name__,
         )
 
     def __get__(self, instance, owner):
         if not instance:
             return self
 
-        metadata = {}
+        metadata = instance.__dict__.get(self._cache_key)
+
+        if metadata is None:
+            if storage.is_document_storage():
+                metadata = storage.loads(getattr(instance, self.document))
+            else:
+                metadata = {}
+
+                for key, value in self._query(instance).with_entities(
+                        self.metadata_model.key, self.metadata_model.value):
+                    metadata[key] = value
 
-        for md in self._metadata_model.query.filter_by(**{self._fk: instance.id}):
-            metadata[md.key] = md.value
+            instance.__dict__[self._cache_key] = metadata
 
-        return metadata
+        return dict(metadata)
 
     def __set__(self, instance, value):
-        if not instance:
-            return self
+        self.replace(instance, value)
+
+    def _query(self, instance):
+        return self.metadata_model.query.filter_by(**{self.fk: instance.id})
+
+    def _insert(self, instance, value):
+        self.metadata_model.bulk_create([
+            {self.fk: instance.id, 'key': k, 'value': v}
+            for k, v in value.items()
+        ])
+
+    def matches(self, id_column, key, value):
+        """
+        Condition for parent rows what have metadata key with value.
+        It's semi-join by index of metadata table.
+        """
+        return id_column.in_(
+            self.metadata_model.query.with_entities(
+                getattr(self.metadata_model, self.fk),
+            ).filter(
+                self.metadata_model.key == key,
+                self.metadata_model.value == value,
+            ),
+        )
+
+    def preload(self, instances):
+        """
+        Load metadata for list of instances with one query.
+        Documents are loaded with instances already.
+        """
+        if storage.is_document_storage():
+            return
+
+        metadata = dict((i.id, {}) for i in instances)
+
+        if metadata:
+            fk = getattr(self.metadata_model, self.fk)
+            query = self.metadata_model.query.with_entities(
+                fk, self.metadata_model.key, self.metadata_model.value,
+            ).filter(fk.in_(list(metadata.keys())))
+
+            for instance_id, key, value in query:
+                metadata[instance_id][key] = value
+
+        for instance in instances:
+            instance.__dict__[self._cache_key] = metadata[instance.id]
+
+    def replace(self, instance, value):
+        """
+        Drop all metadata of instance and write value instead of.
+        """
+        if storage.is_document_storage():
+            setattr(instance, self.document, storage.dumps(value))
+
+        if not storage.is_document_storage() or storage.indexed_keys:
+            self._query(instance).delete(synchronize_session=False)
+            self._insert(instance, storage.rows_of(value))
+
+        instance.__dict__[self._cache_key] = dict(value)
+
+    def merge(self, instance, value):
+        """
+        Write keys of value over existing metadata, other keys are kept.
+        """
+        if not value:
+            return
+
+        if storage.is_document_storage():
+            setattr(instance, self.document, storage.dumps(
+                dict(self.__get__(instance, type(instance)), **value),
+            ))
+
+        rows = storage.rows_of(value)
+
+        if rows:
+            self._query(instance).filter(
+                self.metadata_model.key.in_(list(rows.keys())),
+            ).delete(synchronize_session=False)
+            self._insert(instance, rows)
 
-        metadata = {}
+        metadata = instance.__dict__.get(self._cache_key)
 
-        for k, v in value.items():
-            md = self._metadata_model.create(key=k, value=v, **{self._fk: instance.id})
-            metadata[md.key] = md.value
+        if metadata is not None:
+            metadata.update(value)
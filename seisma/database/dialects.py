@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""
+Parts of setup what depend on kind of database.
+Dialect is chosen by URI or by driver, e.g. mysql+mysqldb, postgresql+psycopg2.
+"""
+
+import os
+import copy
+
+from sqlalchemy import text
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+from sqlalchemy.engine.url import make_url
+
+from .. import constants
+
+
+DEFAULT_DRIVER = 'mysql+mysqlconnector'
+
+
+class Dialect(object):
+
+    name = None
+    pooled = True
+
+    def __repr__(self):
+        return '<Dialect: {}>'.format(self.name)
+
+    def make_uri(self, driver, config):
+        return '{driver}://{user}:{password}@{host}:{port}/{name}'.format(
+            driver=driver,
+            user=config['USER'],
+            password=config['PASSWORD'],
+            host=config['HOST'],
+            port=config['PORT'],
+            name=config['NAME'],
+        )
+
+    def create_database_if_not_exists(self, uri):
+        pass
+
+    @staticmethod
+    def server_engine(uri, database=None, **options):
+        """
+        Engine what is connected to server without database of application.
+        """
+        url = copy.copy(make_url(uri))
+        url.database = database
+
+        return create_engine(url, poolclass=NullPool, **options)
+
+
+class MySQLDialect(Dialect):
+
+    name = 'mysql'
+
+    def make_uri(self, driver, config):
+        return super(MySQLDialect, self).make_uri(driver, config) + '?charset=utf8&use_unicode=1'
+
+    def create_database_if_not_exists(self, uri):
+        engine = self.server_engine(uri)
+
+        try:
+            engine.execute(
+                'CREATE DATABASE IF NOT EXISTS `{}` '
+                'DEFAULT CHARACTER SET utf8 '
+                'DEFAULT COLLATE utf8_general_ci'.format(make_url(uri).database),
+            )
+        finally:
+            engine.dispose()
+
+
+class PostgreSQLDialect(Dialect):
+
+    name = 'postgresql'
+
+    def create_database_if_not_exists(self, uri):
+        database = make_url(uri).database
+        # database can not be created inside of transaction
+        engine = self.server_engine(uri, database='postgres', isolation_level='AUTOCOMMIT')
+
+        try:
+            exists = engine.execute(
+                text('SELECT 1 FROM pg_database WHERE datname = :name'), name=database,
+            ).scalar()
+
+            if not exists:
+                engine.execute('CREATE DATABASE "{}" ENCODING \'UTF8\''.format(database))
+        finally:
+            engine.dispose()
+
+
+class SQLiteDialect(Dialect):
+
+    name = 'sqlite'
+    pooled = False
+
+    def make_uri(self, driver, config):
+        path = config['NAME']
+
+        if not os.path.isabs(path):
+            path = os.path.join(constants.SEISMA_DATA_DIR, '{}.db'.format(path))
+
+        return '{}:///{}'.format(driver, path)
+
+
+DIALECTS = dict(
+    (d.name, d) for d in (MySQLDialect(), PostgreSQLDialect(), SQLiteDialect())
+)
+
+
+def get_dialect(uri_or_driver):
+    name = uri_or_driver.split(':', 1)[0].split('+', 1)[0]
+
+    if name not in DIALECTS:
+        raise RuntimeError(
+            'Database "{}" is not supported, choose from ({})'.format(name, ', '.join(sorted(DIALECTS))),
+        )
+
+    return DIALECTS[name]
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+"""
+Fingerprint of failure reason.
+
+Parts of reason what differ between runs of the same failure
+(addresses, line numbers, temporary paths, timestamps, ids)
+are replaced by placeholders, then normalized reason is hashed.
+"""
+
+import re
+import hashlib
+
+
+FAILED_STATUSES = ('failed', 'error')
+
+FINGERPRINT_LENGTH = 40
+
+PATTERNS = (
+    # temporary paths before line numbers, they can contain numbers
+    (re.compile(r'(/private)?/(tmp|var/tmp|var/folders)/[^\s"\',:;)]*'), '<tmp>'),
+    (re.compile(r'[a-z]:\\\\?(users\\\\?[^\\\s]+\\\\?appdata\\\\?local\\\\?)?temp\\[^\s"\',:;)]*', re.IGNORECASE), '<tmp>'),
+    (re.compile(r'\d{4}-\d{2}-\d{2}[t ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(z|[+-]\d{2}:?\d{2})?', re.IGNORECASE), '<ts>'),
+    (re.compile(r'\b\d{2}:\d{2}:\d{2}(\.\d+)?\b'), '<ts>'),
+    (re.compile(r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b', re.IGNORECASE), '<uuid>'),
+    (re.compile(r'\b0x[0-9a-f]+\b', re.IGNORECASE), '<addr>'),
+    (re.compile(r'\bline \d+', re.IGNORECASE), 'line <n>'),
+    (re.compile(r'(\.\w+|<tmp>):\d+(:\d+)?'), r'\1:<n>'),
+    (re.compile(r'\s+'), ' '),
+)
+
+
+def normalize(reason):
+    for pattern, replacement in PATTERNS:
+        reason = pattern.sub(replacement, reason)
+
+    return reason.strip()
+
+
+def make_fingerprint(status, reason):
+    """
+    Fingerprint of failed case result or None.
+    """
+    if status not in FAILED_STATUSES or not reason:
+        return None
+
+    return hashlib.sha1(normalize(reason).encode('utf-8')).hexdigest()
+
+
+def column_default(context):
+    """
+    Default value of column, it's computed from values of inserted row.
+    """
+    params = context.current_parameters
+
+    return make_fingerprint(params.get('status'), params.get('reason'))
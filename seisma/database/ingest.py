@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+import random
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from . import cache
+from . import rollups
+from . import metadata
+from .alchemy import alchemy
+from . import schema as db
+
+
+def get_case_ids(job_id, names, locking=False):
+    """
+    Get ids of cases by names, cached ids are not requested.
+    Locking read sees cases what were committed by concurrent transactions.
+    """
+    case_ids = {}
+    not_cached = []
+
+    for name in names:
+        case_id = cache.names.get(('case', job_id, name))
+
+        if case_id is None:
+            not_cached.append(name)
+        else:
+            case_ids[name] = case_id
+
+    if not_cached:
+        query = alchemy.session.query(db.Case.name, db.Case.id).filter(
+            db.Case.job_id == job_id,
+            db.Case.name.in_(not_cached),
+        )
+
+        if locking:
+            query = query.with_for_update(read=True)
+
+        for name, case_id in query:
+            case_ids[name] = case_id
+            cache.names.set(('case', job_id, name), case_id)
+
+    return case_ids
+
+
+def create_cases(job_id, names):
+    """
+    Create cases of a job with one multi-row insert.
+    Cases what were created by concurrent transaction are skipped.
+    """
+    try:
+        with alchemy.session.begin_nested():
+            db.Case.bulk_create([{'job_id': job_id, 'name': n} for n in names])
+    except IntegrityError:
+        # some cases were created by concurrent transaction,
+        # so every case is created once more by itself
+        for name in names:
+            try:
+                with alchemy.session.begin_nested():
+                    db.Case.bulk_create([{'job_id': job_id, 'name': name}])
+            except IntegrityError:
+                pass
+
+
+INGEST_BATCH_BITS = 63
+
+
+def make_ingest_batch():
+    return random.SystemRandom().getrandbits(INGEST_BATCH_BITS)
+
+
+def get_batch_case_result_ids(build_id, ingest_batch):
+    """
+    Fetch ids of case results of a build inserted with batch token.
+    Rows of one multi-row insert get ascending ids, so ids are in order of rows.
+    Token is cleared after read.
+    """
+    query = alchemy.session.query(db.CaseResult.id).filter(
+        db.CaseResult.build_id == build_id,
+        db.CaseResult.ingest_batch == ingest_batch,
+    ).order_by(db.CaseResult.id)
+
+    ids = [r[0] for r in query]
+
+    if ids:
+        alchemy.session.query(db.CaseResult).filter(
+            db.CaseResult.id.in_(ids),
+        ).update({'ingest_batch': None}, synchronize_session=False)
+
+    return ids
+
+
+def add_case_results(job_id, build_id, results, autocreation=False, commit=True, dates=None):
+    """
+    Write case results to a build with multi-row inserts.
+    Returns list of outcomes in the same order as results.
+    Dates of results can be given as list of the same length.
+    """
+    names = set(r['name'] for r in results)
+    case_ids = get_case_ids(job_id, names)
+
+    missing = names.difference(case_ids)
+
+    if missing and autocreation:
+        create_cases(job_id, missing)
+        case_ids.update(get_case_ids(job_id, missing, locking=True))
+
+    now = datetime.now()
+    document_storage = metadata.is_document_storage()
+    # rows with metadata are found by token after insert
+    ingest_batch = make_ingest_batch()
+
+    rows = []
+    outcomes = []
+    with_metadata = []
+
+    for i, result in enumerate(results):
+        case_id = case_ids.get(result['name'])
+
+        if case_id is None:
+            outcomes.append({
+                'name': result['name'],
+                'created': False,
+                'messages': ['Case "{}" is not found'.format(result['name'])],
+            })
+            continue
+
+        rows.append({
+            'case_id': case_id,
+            'build_id': build_id,
+            'date': dates[i] if dates else now,
+            'status': result['status'],
+            'runtime': result['runtime'],
+            'reason': result.get('reason', ''),
+        })
+
+        if document_storage:
+            rows[-1]['md_document'] = metadata.dumps(result.get('metadata'))
+
+        outcomes.append({
+            'name': result['name'],
+            'created': True,
+        })
+
+        # only indexed keys are written to rows in document storage
+        values = metadata.rows_of(result.get('metadata'))
+
+        rows[-1]['ingest_batch'] = ingest_batch if values else None
+
+        if values:
+            with_metadata.append(values)
+
+    db.CaseResult.bulk_create(rows)
+    rollups.add_case_results(
+        (r['case_id'], r['date'], r['status'], r['runtime']) for r in rows
+    )
+
+    if with_metadata:
+        ids = get_batch_case_result_ids(build_id, ingest_batch)
+
+        if len(ids) != len(with_metadata):
+            raise RuntimeError(
+                'Ingest batch {} of build {} has {} rows instead of {}'.format(
+                    ingest_batch, build_id, len(ids), len(with_metadata),
+                ),
+            )
+
+        md_rows = []
+
+        for case_result_id, values in zip(ids, with_metadata):
+            md_rows.extend(
+                {'case_result_id': case_result_id, 'key': k, 'value': v}
+                for k, v in values.items()
+            )
+
+        db.CaseResultMetadata.bulk_create(md_rows)
+
+    if commit:
+        alchemy.session.commit()
+
+    return outcomes
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""
+Storage of metadata of builds and case results.
+
+In "rows" mode every key is a row of metadata table.
+In "document" mode metadata is one json document in column of parent row,
+so it is loaded together with the row and written by one update.
+Indexed keys are written to rows too in "document" mode, so parent rows
+can be filtered by them.
+"""
+
+import logging
+import json as _json
+
+from sqlalchemy import bindparam
+
+from .alchemy import alchemy
+
+
+logger = logging.getLogger(__name__)
+
+
+ROWS_STORAGE = 'rows'
+DOCUMENT_STORAGE = 'document'
+
+STORAGES = (ROWS_STORAGE, DOCUMENT_STORAGE)
+
+DEFAULT_STORAGE = ROWS_STORAGE
+DEFAULT_CHUNK_SIZE = 1000
+
+
+storage = DEFAULT_STORAGE
+indexed_keys = frozenset()
+
+
+def set_storage(name):
+    global storage
+
+    if name not in STORAGES:
+        raise RuntimeError(
+            'Metadata storage "{}" is not in ({})'.format(name, ', '.join(STORAGES)),
+        )
+
+    storage = name
+
+
+def set_indexed_keys(keys):
+    global indexed_keys
+    indexed_keys = frozenset(keys)
+
+
+def is_document_storage():
+    return storage == DOCUMENT_STORAGE
+
+
+def is_filterable(key):
+    return not is_document_storage() or key in indexed_keys
+
+
+def rows_of(value):
+    """
+    Part of metadata what is stored as rows.
+    """
+    if not is_document_storage() or not value:
+        return value
+
+    return dict((k, v) for k, v in value.items() if k in indexed_keys)
+
+
+def dumps(value):
+    return _json.dumps(value, separators=(',', ':'), sort_keys=True) if value else None
+
+
+def loads(document):
+    return _json.loads(document) if document else {}
+
+
+def convert_to_documents(model, chunk_size=DEFAULT_CHUNK_SIZE, delete_rows=False):
+    """
+    Write metadata rows of model to documents by chunks of parent rows.
+    Rows are merged into existing documents, parent rows written
+    in document mode keep keys what are not indexed.
+    Every chunk is converted in its own transaction.
+    Returns count of converted parent rows.
+    """
+    prop = model.md
+    table = model.__table__
+    metadata_model = prop.metadata_model
+    fk = getattr(metadata_model, prop.fk)
+    document_column = getattr(model, prop.document)
+
+    statement = table.update().where(
+        table.c.id == bindparam('b_id'),
+    ).values(**{prop.document: bindparam('b_document')})
+
+    last_id = 0
+    count = 0
+
+    while True:
+        existing = alchemy.session.query(model.id, document_column).filter(
+            model.id > last_id,
+        ).order_by(model.id).limit(chunk_size).all()
+
+        if not existing:
+            return count
+
+        ids = [r[0] for r in existing]
+        existing = dict(existing)
+        documents = {}
+
+        for parent_id, key, value in metadata_model.query.with_entities(
+            fk, metadata_model.key, metadata_model.value,
+        ).filter(fk.in_(ids)):
+            if parent_id not in documents:
+                documents[parent_id] = loads(existing[parent_id])
+
+            documents[parent_id][key] = value
+
+        if documents:
+            alchemy.session.execute(statement, [
+                {'b_id': parent_id, 'b_document': dumps(document)}
+                for parent_id, document in documents.items()
+            ])
+
+            if delete_rows:
+                # rows of indexed keys are used by filters
+                metadata_model.query.filter(
+                    fk.in_(ids), ~metadata_model.key.in_(list(indexed_keys) or ['']),
+                ).delete(synchronize_session=False)
+
+        alchemy.session.commit()
+
+        last_id = ids[-1]
+        count += len(ids)
+
+        logger.info('Metadata of %d rows of %s have been converted', count, table.name)
+
+
+def setup(app):
+    set_storage(app.config.get('METADATA_STORAGE', DEFAULT_STORAGE))
+    set_indexed_keys(app.config.get('METADATA_INDEXED_KEYS', ()))
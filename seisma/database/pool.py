@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats(object):
+    """
+    Thread safe counters of connection checkouts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+        self.checked_out_max = 0
+        self.overflow_max = 0
+
+    def add_checkout(self, wait, checked_out, overflow):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_sum += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.checked_out_max = max(self.checked_out_max, checked_out)
+            self.overflow_max = max(self.overflow_max, overflow)
+
+    def add_timeout(self, wait):
+        with self._lock:
+            self.timeouts += 1
+            self.wait_sum += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def to_dict(self):
+        return {
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'wait_avg': self.wait_sum / self.checkouts if self.checkouts else None,
+            'wait_max': self.wait_max,
+            'checked_out_max': self.checked_out_max,
+            'overflow_max': self.overflow_max,
+        }
+
+
+class TimedQueuePool(QueuePool):
+    """
+    Queue pool what measures how long connections are waited for.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(TimedQueuePool, self).__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        started = time.time()
+
+        try:
+            connection = super(TimedQueuePool, self)._do_get()
+        except TimeoutError:
+            self.stats.add_timeout(time.time() - started)
+            raise
+
+        self.stats.add_checkout(time.time() - started, self.checkedout(), max(self.overflow(), 0))
+
+        return connection
+
+    def telemetry(self):
+        return dict(
+            self.stats.to_dict(),
+            size=self.size(),
+            max_overflow=self._max_overflow,
+            checked_in=self.checkedin(),
+            checked_out=self.checkedout(),
+            overflow=max(self.overflow(), 0),
+        )
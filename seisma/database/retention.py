@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+"""
+Retention of raw case results.
+
+Case results what are older than retention period are moved
+to gzipped files of json lines by small chunks, every chunk is
+written to file and deleted from database in its own short transaction.
+Chunks are ranges of primary key, so every chunk is found without
+scanning of case results what are left.
+Daily rollups are not touched.
+"""
+
+import os
+import gzip
+import time
+import logging
+import datetime
+import json as _json
+
+from sqlalchemy import func
+
+from .alchemy import alchemy
+from . import schema as db
+from . import metadata as storage
+from .. import constants
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_PAUSE = 0.1
+DEFAULT_ARCHIVE_DIR = os.path.join(constants.SEISMA_DATA_DIR, 'archive')
+
+ARCHIVE_FILE_EXTENSION = '.jsonl.gz'
+
+
+def to_archive_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+
+    return value
+
+
+def get_archive_path(directory, cutoff):
+    return os.path.join(
+        directory,
+        'case_result-{}-{}{}'.format(
+            cutoff.strftime('%Y%m%d'),
+            datetime.datetime.now().strftime('%Y%m%d%H%M%S'),
+            ARCHIVE_FILE_EXTENSION,
+        ),
+    )
+
+
+def get_cutoff(days):
+    """
+    Case results before the date are out of retention period.
+    """
+    return datetime.datetime.combine(
+        datetime.date.today() - datetime.timedelta(days=days),
+        datetime.time.min,
+    )
+
+
+def get_id_range(cutoff):
+    """
+    The first and the last id of case results older than cutoff.
+    """
+    return alchemy.session.query(
+        func.min(db.CaseResult.id), func.max(db.CaseResult.id),
+    ).filter(db.CaseResult.date < cutoff).one()
+
+
+def archive_chunk(cutoff, fp, first_id, last_id):
+    """
+    Move case results older than cutoff with ids from first_id
+    to last_id inclusive to archive file.
+    Returns count of moved case results.
+    """
+    ids = [
+        r[0] for r in alchemy.session.query(db.CaseResult.id).filter(
+            db.CaseResult.id >= first_id,
+            db.CaseResult.id <= last_id,
+            db.CaseResult.date < cutoff,
+        )
+    ]
+
+    if not ids:
+        alchemy.session.commit()
+        return 0
+
+    # rows of metadata could be kept after conversion to documents
+    metadata = {}
+
+    for case_result_id, key, value in alchemy.session.query(
+        db.CaseResultMetadata.case_result_id,
+        db.CaseResultMetadata.key,
+        db.CaseResultMetadata.value,
+    ).filter(db.CaseResultMetadata.case_result_id.in_(ids)):
+        metadata.setdefault(case_result_id, {})[key] = value
+
+    rows = alchemy.session.query(
+        db.CaseResult.id,
+        db.Case.job_id,
+        db.Case.name.label('case'),
+        db.Build.name.label('build'),
+        db.CaseResult.date,
+        db.CaseResult.status,
+        db.CaseResult.runtime,
+        db.CaseResult.reason,
+        db.CaseResult.md_document,
+    ).join(
+        db.Case, db.Case.id == db.CaseResult.case_id,
+    ).join(
+        db.Build, db.Build.id == db.CaseResult.build_id,
+    ).filter(db.CaseResult.id.in_(ids))
+
+    for row in rows:
+        record = dict((k, to_archive_value(v)) for k, v in zip(row.keys(), row))
+        record['metadata'] = dict(storage.loads(record.pop('md_document')), **metadata.get(row.id, {}))
+        fp.write((_json.dumps(record) + '\n').encode('utf-8'))
+
+    # records must be on disk before they are deleted from database
+    fp.flush()
+    os.fsync(fp.fileno())
+
+    db.CaseResultMetadata.query.filter(
+        db.CaseResultMetadata.case_result_id.in_(ids),
+    ).delete(synchronize_session=False)
+    db.CaseResult.query.filter(
+        db.CaseResult.id.in_(ids),
+    ).delete(synchronize_session=False)
+
+    alchemy.session.commit()
+
+    return len(ids)
+
+
+def archive(days, directory=None, chunk_size=DEFAULT_CHUNK_SIZE, pause=DEFAULT_PAUSE):
+    """
+    Move case results older than days to archive file.
+    Chunk what was archived but not deleted because of failure
+    will be archived again on next run.
+    Returns path of archive file and count of moved case results.
+    """
+    directory = directory or DEFAULT_ARCHIVE_DIR
+    cutoff = get_cutoff(days)
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    first_id, last_id = get_id_range(cutoff)
+    alchemy.session.commit()
+
+    if first_id is None:
+        return None, 0
+
+    path = get_archive_path(directory, cutoff)
+    count = 0
+
+    with open(path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as fp:
+            for chunk_first_id in range(first_id, last_id + 1, chunk_size):
+                try:
+                    moved = archive_chunk(
+                        cutoff, fp, chunk_first_id, min(chunk_first_id + chunk_size - 1, last_id),
+                    )
+                except Exception:
+                    alchemy.session.rollback()
+                    raise
+
+                if not moved:
+                    continue
+
+                count += moved
+                logger.info('%d case results older than %s have been archived to %s', count, cutoff, path)
+
+                # let other transactions take locks of hot tables
+                time.sleep(pause)
+
+    if not count:
+        os.remove(path)
+        return None, 0
+
+    return path, count
+
+
+def archive_by_config(app, days=None):
+    config = app.config.get('RETENTION', {})
+    days = days or config.get('DAYS')
+
+    if not days:
+        raise RuntimeError('Retention period is not configured, set RETENTION["DAYS"]')
+
+    return archive(
+        days,
+        directory=config.get('ARCHIVE_DIR'),
+        chunk_size=config.get('CHUNK_SIZE', DEFAULT_CHUNK_SIZE),
+        pause=config.get('PAUSE', DEFAULT_PAUSE),
+    )
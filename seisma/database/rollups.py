@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import datetime
+
+from sqlalchemy import and_
+from sqlalchemy import case
+from sqlalchemy import func
+from sqlalchemy import literal
+from sqlalchemy import bindparam
+from sqlalchemy.exc import IntegrityError
+
+from .alchemy import alchemy
+from . import schema as db
+
+
+logger = logging.getLogger(__name__)
+
+
+CASE_KEYS = ('case_id', 'date')
+CASE_ADDITIVE = db.CASE_STATUSES_CHOICE + ('runtime_sum', 'runtime_count')
+
+JOB_KEYS = ('job_id', 'date')
+JOB_ADDITIVE = ('builds_count', 'success_count', 'runtime_sum')
+
+
+def increment(model, keys, rows, additive, minimal=(), maximal=()):
+    """
+    Add values to rollup rows of model within the current transaction.
+    Rows is a dictionary of key values -> dictionary of column values.
+    Missing rollup rows are inserted, existing ones are updated in place.
+    """
+    if not rows:
+        return
+
+    table = model.__table__
+    key_columns = [table.c[k] for k in keys]
+
+    existing = set(
+        tuple(r) for r in alchemy.session.query(*key_columns).filter(
+            *[c.in_(set(k[i] for k in rows)) for i, c in enumerate(key_columns)]
+        )
+    )
+    missing = [k for k in rows if k not in existing]
+    to_update = [k for k in rows if k in existing]
+
+    if missing:
+        try:
+            with alchemy.session.begin_nested():
+                alchemy.session.execute(
+                    table.insert(),
+                    [dict(zip(keys, k), **rows[k]) for k in missing],
+                )
+        except IntegrityError:
+            # some rows were inserted by concurrent transaction.
+            # Snapshot of select above will never show them, but update
+            # reads the latest committed row, so every key is inserted
+            # once more by itself and updated if it's a duplicate again.
+            for k in missing:
+                try:
+                    with alchemy.session.begin_nested():
+                        alchemy.session.execute(table.insert(), dict(zip(keys, k), **rows[k]))
+                except IntegrityError:
+                    to_update.append(k)
+
+    if not to_update:
+        return
+
+    values = {}
+
+    for column in additive:
+        values[column] = table.c[column] + bindparam('b_' + column)
+
+    for column in minimal:
+        param = bindparam('b_' + column)
+        values[column] = case([(table.c[column] > param, param)], else_=table.c[column])
+
+    for column in maximal:
+        param = bindparam('b_' + column)
+        values[column] = case([(table.c[column] < param, param)], else_=table.c[column])
+
+    statement = table.update().where(
+        and_(*[table.c[k] == bindparam('k_' + k) for k in keys]),
+    ).values(**values)
+
+    alchemy.session.execute(statement, [
+        dict(
+            [('k_' + k, v) for k, v in zip(keys, key)] +
+            [('b_' + c, v) for c, v in rows[key].items()]
+        )
+        for key in to_update
+    ])
+
+
+def add_case_results(case_results):
+    """
+    Take case results into daily rollups of cases.
+    Case results is iterable of (case_id, date, status, runtime).
+    """
+    rows = {}
+
+    for case_id, date, status, runtime in case_results:
+        key = (case_id, date.date())
+        row = rows.get(key)
+
+        if row is None:
+            row = rows[key] = dict((s, 0) for s in db.CASE_STATUSES_CHOICE)
+            row.update(
+                runtime_sum=0.0,
+                runtime_count=0,
+                runtime_min=runtime,
+                runtime_max=runtime,
+            )
+
+        row[status] += 1
+        row['runtime_sum'] += runtime
+        row['runtime_count'] += 1
+        row['runtime_min'] = min(row['runtime_min'], runtime)
+        row['runtime_max'] = max(row['runtime_max'], runtime)
+
+    increment(
+        db.CaseDailyStat, CASE_KEYS, rows, CASE_ADDITIVE,
+        minimal=('runtime_min',), maximal=('runtime_max',),
+    )
+
+
+def add_build(job_id, date, was_success, runtime):
+    """
+    Take finished build into daily rollup of job.
+    """
+    rows = {
+        (job_id, date.date()): {
+            'builds_count': 1,
+            'success_count': 1 if was_success else 0,
+            'runtime_sum': runtime,
+        },
+    }
+    increment(db.JobDailyStat, JOB_KEYS, rows, JOB_ADDITIVE)
+
+
+def count_if(condition):
+    return func.sum(case([(condition, 1)], else_=0))
+
+
+def rebuild_day(day):
+    start = datetime.datetime.combine(day, datetime.time.min)
+    end = start + datetime.timedelta(days=1)
+
+    db.CaseDailyStat.query.filter(db.CaseDailyStat.date == day).delete(synchronize_session=False)
+    db.JobDailyStat.query.filter(db.JobDailyStat.date == day).delete(synchronize_session=False)
+
+    cases = alchemy.session.query(
+        db.CaseResult.case_id,
+        literal(day, type_=alchemy.Date),
+        *[count_if(db.CaseResult.status == s) for s in db.CASE_STATUSES_CHOICE] + [
+            func.sum(db.CaseResult.runtime),
+            func.count(db.CaseResult.id),
+            func.min(db.CaseResult.runtime),
+            func.max(db.CaseResult.runtime),
+        ]
+    ).filter(
+        db.CaseResult.date >= start,
+        db.CaseResult.date < end,
+    ).group_by(db.CaseResult.case_id)
+
+    alchemy.session.execute(
+        db.CaseDailyStat.__table__.insert().from_select(
+            CASE_KEYS + CASE_ADDITIVE + ('runtime_min', 'runtime_max'),
+            cases.statement,
+        ),
+    )
+
+    jobs = alchemy.session.query(
+        db.Build.job_id,
+        literal(day, type_=alchemy.Date),
+        func.count(db.Build.id),
+        count_if(db.Build.was_success),
+        func.sum(db.Build.runtime),
+    ).filter(
+        db.Build.is_running == False,
+        db.Build.date >= start,
+        db.Build.date < end,
+    ).group_by(db.Build.job_id)
+
+    alchemy.session.execute(
+        db.JobDailyStat.__table__.insert().from_select(
+            JOB_KEYS + JOB_ADDITIVE,
+            jobs.statement,
+        ),
+    )
+
+
+def rebuild(date_from=None, date_to=None):
+    """
+    Recalculate rollups from case results and finished builds.
+    Every day is rebuilt in its own short transaction.
+    """
+    if date_from is None or date_to is None:
+        first, last_build = alchemy.session.query(
+            func.min(db.Build.date), func.max(db.Build.date),
+        ).one()
+        last_case_result = alchemy.session.query(func.max(db.CaseResult.date)).scalar()
+
+        if first is None:
+            return
+
+        date_from = date_from or first.date()
+        date_to = date_to or max(last_build, last_case_result or last_build).date()
+
+    day = date_from
+
+    while day <= date_to:
+        rebuild_day(day)
+        alchemy.session.commit()
+
+        logger.info('Rollups of %s have been rebuilt', day)
+
+        day += datetime.timedelta(days=1)
@@ -3,16 +3,62 @@
 from datetime import date
 from datetime import datetime
 
+from sqlalchemy import Index
 from sqlalchemy import UniqueConstraint
 
+from . import cache
 from .alchemy import alchemy
 from .alchemy import ModelMixin
 from ..json import ObjectConverter
 from .descriptors import MetadataProperty
+from .fingerprint import FINGERPRINT_LENGTH
+from .fingerprint import column_default as fingerprint_default
 
 
 CASE_STATUSES_CHOICE = ('passed', 'skipped', 'failed', 'error')
 
+METADATA_VALUE_PREFIX_LENGTH = 255
+
+
+def get_by_cached_id(model, key, **filters):
+    """
+    Get object by filters, id of found object is cached by key.
+    Object of cached id is checked with filters again.
+    """
+    obj_id = cache.names.get(key)
+
+    if obj_id is not None:
+        obj = model.query.get(obj_id)
+
+        if obj is not None and all(getattr(obj, k) == v for k, v in filters.items()):
+            return obj
+
+        cache.names.invalidate(key)
+
+    obj = model.query.filter_by(**filters).first()
+
+    if obj is not None:
+        cache.names.set(key, obj.id)
+
+    return obj
+
+
+def get_cached_id(model, key, **filters):
+    """
+    Get id of object by filters, id is cached by key.
+    Cached id is returned without query, for callers what need id only.
+    """
+    obj_id = cache.names.get(key)
+
+    if obj_id is not None:
+        return obj_id
+
+    row = alchemy.session.query(model.id).filter_by(**filters).first()
+
+    if row is not None:
+        cache.names.set(key, row[0])
+        return row[0]
+
 
 class Job(alchemy.Model, ModelMixin):
 
@@ -32,7 +78,11 @@ class Job(alchemy.Model, ModelMixin):
 
     @classmethod
     def get_by_name(cls, name):
-        return cls.query.filter_by(name=name, is_active=True).first()
+        return get_by_cached_id(cls, ('job', name), name=name, is_active=True)
+
+    @classmethod
+    def get_id_by_name(cls, name):
+        return get_cached_id(cls, ('job', name), name=name, is_active=True)
 
 
 class Case(alchemy.Model, ModelMixin):
@@ -59,11 +109,27 @@ class Case(alchemy.Model, ModelMixin):
         ObjectConverter.FromAttribute('description'),
     )
 
+    @classmethod
+    def get_by_name(cls, job_id, name):
+        return get_by_cached_id(cls, ('case', job_id, name), job_id=job_id, name=name)
+
+    @classmethod
+    def get_id_by_name(cls, job_id, name):
+        return get_cached_id(cls, ('case', job_id, name), job_id=job_id, name=name)
+
 
 class BuildMetadata(alchemy.Model, ModelMixin):
 
     __tablename__ = 'build_metadata'
 
+    __table_args__ = (
+        Index(
+            'ix_build_metadata_key_value_build_id', 'key', 'value', 'build_id',
+            mysql_length={'value': METADATA_VALUE_PREFIX_LENGTH},
+        ),
+        ModelMixin.__table_args__,
+    )
+
     id = alchemy.Column(alchemy.Integer, autoincrement=True, primary_key=True)
     build_id = alchemy.Column(alchemy.Integer, alchemy.ForeignKey('build.id'), nullable=False)
     key = alchemy.Column(alchemy.String(255), nullable=False)
@@ -80,6 +146,7 @@ class Build(alchemy.Model, ModelMixin):
             'job_id',
             name='build_name',
         ),
+        Index('ix_build_job_id_date', 'job_id', 'date'),
     )
 
     id = alchemy.Column(alchemy.Integer, autoincrement=True, primary_key=True)
@@ -93,8 +160,9 @@ class Build(alchemy.Model, ModelMixin):
     runtime = alchemy.Column(alchemy.Float(), nullable=False)
     was_success = alchemy.Column(alchemy.Boolean(), nullable=False)
     is_running = alchemy.Column(alchemy.Boolean(), nullable=False, default=True)
+    md_document = alchemy.Column(alchemy.Text(), nullable=True)
 
-    md = MetadataProperty(BuildMetadata, fk='build_id')
+    md = MetadataProperty(BuildMetadata, fk='build_id', document='md_document')
 
     to_dict = ObjectConverter(
         ObjectConverter.FromAttribute('name'),
@@ -109,11 +177,45 @@ class Build(alchemy.Model, ModelMixin):
         ObjectConverter.FromAttribute('md', alias='metadata'),
     )
 
+    @classmethod
+    def get_by_name(cls, job_id, name):
+        return get_by_cached_id(cls, ('build', job_id, name), job_id=job_id, name=name)
+
+    @classmethod
+    def get_id_by_name(cls, job_id, name):
+        return get_cached_id(cls, ('build', job_id, name), job_id=job_id, name=name)
+
+    def version_stamp(self):
+        """
+        Version of build what is changed by stop command.
+        Metadata is taken into account, it's merged by stop of finished build too.
+        """
+        return (
+            self.id,
+            self.is_running,
+            self.runtime,
+            self.was_success,
+            self.tests_count,
+            self.success_count,
+            self.fail_count,
+            self.error_count,
+            sorted(self.md.items()),
+        )
+
 
 class CaseResultMetadata(alchemy.Model, ModelMixin):
 
     __tablename__ = 'case_result_metadata'
 
+    __table_args__ = (
+        Index('ix_case_result_metadata_case_result_id_key', 'case_result_id', 'key'),
+        Index(
+            'ix_case_result_metadata_key_value_case_result_id', 'key', 'value', 'case_result_id',
+            mysql_length={'value': METADATA_VALUE_PREFIX_LENGTH},
+        ),
+        ModelMixin.__table_args__,
+    )
+
     id = alchemy.Column(alchemy.Integer, autoincrement=True, primary_key=True)
     case_result_id = alchemy.Column(alchemy.Integer, alchemy.ForeignKey('case_result.id'), nullable=False)
     key = alchemy.Column(alchemy.String(255), nullable=False)
@@ -124,6 +226,16 @@ class CaseResult(alchemy.Model, ModelMixin):
 
     __tablename__ = 'case_result'
 
+    __table_args__ = (
+        Index('ix_case_result_case_id_date', 'case_id', 'date'),
+        Index('ix_case_result_build_id_case_id', 'build_id', 'case_id'),
+        Index('ix_case_result_date', 'date'),
+        Index('ix_case_result_build_id_fingerprint', 'build_id', 'fingerprint'),
+        Index('ix_case_result_fingerprint_date', 'fingerprint', 'date'),
+        Index('ix_case_result_build_id_ingest_batch', 'build_id', 'ingest_batch'),
+        ModelMixin.__table_args__,
+    )
+
     id = alchemy.Column(alchemy.Integer, autoincrement=True, primary_key=True)
     case_id = alchemy.Column(alchemy.Integer, alchemy.ForeignKey('case.id'), nullable=False)
     build_id = alchemy.Column(alchemy.Integer, alchemy.ForeignKey('build.id'), nullable=False)
@@ -131,8 +243,17 @@ class CaseResult(alchemy.Model, ModelMixin):
     reason = alchemy.Column(alchemy.Text(), nullable=False, default='')
     runtime = alchemy.Column(alchemy.Float(), nullable=False)
     status = alchemy.Column(alchemy.Enum(*CASE_STATUSES_CHOICE), nullable=False)
+    md_document = alchemy.Column(alchemy.Text(), nullable=True)
+    # random token of bulk insert to find ids of inserted rows with metadata
+    ingest_batch = alchemy.Column(alchemy.BigInteger(), nullable=True)
+    # computed from status and reason on insert, null for not failed
+    fingerprint = alchemy.Column(
+        alchemy.String(FINGERPRINT_LENGTH), nullable=True, default=fingerprint_default,
+    )
 
-    md = MetadataProperty(CaseResultMetadata, fk='case_result_id')
+    case = alchemy.relationship(Case)
+
+    md = MetadataProperty(CaseResultMetadata, fk='case_result_id', document='md_document')
 
     to_dict = ObjectConverter(
         ObjectConverter.FromAttribute('date'),
@@ -143,6 +264,74 @@ class CaseResult(alchemy.Model, ModelMixin):
         ObjectConverter.FromAttribute('md', alias='metadata'),
     )
 
-    @property
-    def case(self):
-        return Case.query.filter_by(id=self.case_id).first()
+
+class CaseDailyStat(alchemy.Model, ModelMixin):
+
+    __tablename__ = 'case_daily_stat'
+
+    __table_args__ = (
+        UniqueConstraint(
+            'case_id',
+            'date',
+            name='case_daily_stat_date',
+        ),
+        ModelMixin.__table_args__,
+    )
+
+    id = alchemy.Column(alchemy.Integer, autoincrement=True, primary_key=True)
+    case_id = alchemy.Column(alchemy.Integer, alchemy.ForeignKey('case.id'), nullable=False)
+    date = alchemy.Column(alchemy.Date(), nullable=False)
+    passed = alchemy.Column(alchemy.Integer, nullable=False, default=0)
+    skipped = alchemy.Column(alchemy.Integer, nullable=False, default=0)
+    failed = alchemy.Column(alchemy.Integer, nullable=False, default=0)
+    error = alchemy.Column(alchemy.Integer, nullable=False, default=0)
+    runtime_sum = alchemy.Column(alchemy.Float(), nullable=False, default=0.0)
+    runtime_count = alchemy.Column(alchemy.Integer, nullable=False, default=0)
+    runtime_min = alchemy.Column(alchemy.Float(), nullable=False)
+    runtime_max = alchemy.Column(alchemy.Float(), nullable=False)
+
+    to_dict = ObjectConverter(
+        ObjectConverter.FromAttribute('date'),
+        ObjectConverter.FromAttribute('passed'),
+        ObjectConverter.FromAttribute('skipped'),
+        ObjectConverter.FromAttribute('failed'),
+        ObjectConverter.FromAttribute('error'),
+        ObjectConverter.FromAttribute('runtime_min'),
+        ObjectConverter.FromAttribute('runtime_max'),
+        ObjectConverter.FromMethod('runtime_avg'),
+    )
+
+    def runtime_avg(self):
+        return self.runtime_sum / self.runtime_count if self.runtime_count else None
+
+
+class JobDailyStat(alchemy.Model, ModelMixin):
+
+    __tablename__ = 'job_daily_stat'
+
+    __table_args__ = (
+        UniqueConstraint(
+            'job_id',
+            'date',
+            name='job_daily_stat_date',
+        ),
+        ModelMixin.__table_args__,
+    )
+
+    id = alchemy.Column(alchemy.Integer, autoincrement=True, primary_key=True)
+    job_id = alchemy.Column(alchemy.Integer, alchemy.ForeignKey('job.id'), nullable=False)
+    date = alchemy.Column(alchemy.Date(), nullable=False)
+    builds_count = alchemy.Column(alchemy.Integer, nullable=False, default=0)
+    success_count = alchemy.Column(alchemy.Integer, nullable=False, default=0)
+    runtime_sum = alchemy.Column(alchemy.Float(), nullable=False, default=0.0)
+
+    to_dict = ObjectConverter(
+        ObjectConverter.FromAttribute('date'),
+        ObjectConverter.FromAttribute('runtime_sum', alias='runtime'),
+        ObjectConverter.FromAttribute('builds_count'),
+        ObjectConverter.FromAttribute('success_count'),
+        ObjectConverter.FromMethod('success_rate'),
+    )
+
+    def success_rate(self):
+        return self.success_count / float(self.builds_count) if self.builds_count else None
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+
+import math
+import heapq
+
+from sqlalchemy import and_
+from sqlalchemy import desc
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy import union_all
+from sqlalchemy import bindparam
+from sqlalchemy.orm import aliased
+
+from .alchemy import alchemy
+from .rollups import count_if
+from .fingerprint import FAILED_STATUSES
+from .fingerprint import make_fingerprint
+from . import schema as db
+
+
+PERCENTILES = (50, 95, 99)
+
+PASSED_CODE = b'P'
+FAILED_CODE = b'F'
+NOT_RUN_CODE = b' '
+
+# skipped case results are not runs for flakiness
+STATUS_CODES = {
+    'passed': PASSED_CODE,
+    'failed': FAILED_CODE,
+    'error': FAILED_CODE,
+}
+
+IN_CHUNK_SIZE = 1000
+FINGERPRINT_CHUNK_SIZE = 1000
+
+DIFF_CATEGORIES = ('new_failures', 'fixed', 'still_failing', 'added', 'removed')
+
+
+def percentile_offset(count, percent):
+    """
+    Offset of value by nearest-rank method in sorted list of count values.
+    """
+    return max(int(math.ceil(count * percent / 100.0)) - 1, 0)
+
+
+def summary_of_case_results(query):
+    """
+    Aggregate case results of query in database.
+    Percentiles of runtime are taken by offset in sorted runtime.
+    """
+    query = query.order_by(None)
+
+    rows = query.with_entities(
+        db.CaseResult.status,
+        func.count(db.CaseResult.id),
+        func.sum(db.CaseResult.runtime),
+        func.min(db.CaseResult.runtime),
+        func.max(db.CaseResult.runtime),
+    ).group_by(db.CaseResult.status)
+
+    count = 0
+    runtime_sum = 0.0
+    runtime_min = runtime_max = None
+    statuses = dict((s, 0) for s in db.CASE_STATUSES_CHOICE)
+
+    for status, status_count, status_sum, status_min, status_max in rows:
+        count += status_count
+        statuses[status] = status_count
+        runtime_sum += status_sum or 0.0
+        runtime_min = status_min if runtime_min is None else min(runtime_min, status_min)
+        runtime_max = status_max if runtime_max is None else max(runtime_max, status_max)
+
+    runtime = {
+        'min': runtime_min,
+        'max': runtime_max,
+        'avg': runtime_sum / count if count else None,
+    }
+
+    runtime_query = query.with_entities(db.CaseResult.runtime).order_by(db.CaseResult.runtime)
+
+    for percent in PERCENTILES:
+        runtime['p{}'.format(percent)] = runtime_query.offset(
+            percentile_offset(count, percent),
+        ).limit(1).scalar() if count else None
+
+    executed = count - statuses['skipped']
+
+    return {
+        'count': count,
+        'statuses': statuses,
+        'pass_rate': statuses['passed'] / float(executed) if executed else None,
+        'runtime': runtime,
+    }
+
+
+def totals_of_build(build_id):
+    """
+    Count case results of build by statuses with one query.
+    """
+    rows = db.CaseResult.query.with_entities(
+        db.CaseResult.status,
+        func.count(db.CaseResult.id),
+        func.sum(db.CaseResult.runtime),
+    ).filter(
+        db.CaseResult.build_id == build_id,
+    ).group_by(db.CaseResult.status)
+
+    runtime = 0.0
+    statuses = dict((s, 0) for s in db.CASE_STATUSES_CHOICE)
+
+    for status, status_count, status_sum in rows:
+        statuses[status] = status_count
+        runtime += status_sum or 0.0
+
+    return {
+        'runtime': runtime,
+        'tests_count': sum(statuses.values()),
+        'success_count': statuses['passed'],
+        'fail_count': statuses['failed'],
+        'error_count': statuses['error'],
+    }
+
+
+def last_build_ids(job_id, count):
+    """
+    Ids of last builds of job from the oldest to the newest.
+    """
+    rows = alchemy.session.query(db.Build.id).filter(
+        db.Build.job_id == job_id,
+    ).order_by(db.Build.date.desc(), db.Build.id.desc()).limit(count)
+
+    return [r[0] for r in reversed(rows.all())]
+
+
+def flaky_cases(job_id, builds_count, limit):
+    """
+    Find cases what flip between passed and failed in last builds of job.
+    Only cases what failed at least once are taken, statuses of every case
+    are packed to bytes by build order, so flips are counted by bytes.count.
+    Returns list of (case_id, runs, flips, flip_rate, failure_rate)
+    sorted by flip rate and failure rate.
+    """
+    build_ids = last_build_ids(job_id, builds_count)
+
+    if not build_ids:
+        return []
+
+    table = db.CaseResult.__table__
+    positions = dict((build_id, i) for i, build_id in enumerate(build_ids))
+
+    candidates = [
+        r[0] for r in alchemy.session.execute(
+            select([table.c.case_id]).where(
+                table.c.build_id.in_(build_ids),
+            ).where(
+                table.c.status.in_(('failed', 'error')),
+            ).distinct(),
+        )
+    ]
+
+    codes = {}
+
+    for offset in range(0, len(candidates), IN_CHUNK_SIZE):
+        rows = alchemy.session.execute(
+            select([table.c.case_id, table.c.build_id, table.c.status]).where(
+                table.c.build_id.in_(build_ids),
+            ).where(
+                table.c.case_id.in_(candidates[offset:offset + IN_CHUNK_SIZE]),
+            ),
+        )
+
+        for case_id, build_id, status in rows:
+            code = STATUS_CODES.get(status)
+
+            if code is None:
+                continue
+
+            statuses = codes.get(case_id)
+
+            if statuses is None:
+                statuses = codes[case_id] = bytearray(NOT_RUN_CODE * len(build_ids))
+
+            statuses[positions[build_id]] = code[0]
+
+    stats = []
+
+    for case_id, statuses in codes.items():
+        runs = bytes(statuses).replace(NOT_RUN_CODE, b'')
+
+        if len(runs) < 2:
+            continue
+
+        flips = runs.count(PASSED_CODE + FAILED_CODE) + runs.count(FAILED_CODE + PASSED_CODE)
+
+        stats.append((
+            case_id,
+            len(runs),
+            flips,
+            flips / float(len(runs) - 1),
+            runs.count(FAILED_CODE) / float(len(runs)),
+        ))
+
+    return heapq.nlargest(limit, stats, key=lambda s: (s[3], s[4]))
+
+
+def diff_of_builds(build_id, other_build_id):
+    """
+    Compare case results of build with case results of other (reference) build.
+    Returns function what makes query of category
+    and dictionary with counts of categories.
+    """
+    current = aliased(db.CaseResult)
+    other = aliased(db.CaseResult)
+
+    def joined(left, left_build_id, right, right_build_id):
+        return alchemy.session.query(left.id).join(
+            db.Case, db.Case.id == left.case_id,
+        ).outerjoin(
+            right, and_(
+                right.case_id == left.case_id,
+                right.build_id == right_build_id,
+            ),
+        ).filter(left.build_id == left_build_id)
+
+    conditions = {
+        'new_failures': and_(current.status.in_(FAILED_STATUSES), other.status == 'passed'),
+        'fixed': and_(current.status == 'passed', other.status.in_(FAILED_STATUSES)),
+        'still_failing': and_(current.status.in_(FAILED_STATUSES), other.status.in_(FAILED_STATUSES)),
+        'added': other.id == None,
+    }
+
+    row = joined(current, build_id, other, other_build_id).with_entities(
+        *[count_if(conditions[c]) for c in DIFF_CATEGORIES[:-1]]
+    ).one()
+
+    counts = dict(zip(DIFF_CATEGORIES, [int(v or 0) for v in row]))
+    counts['removed'] = joined(other, other_build_id, current, build_id).filter(
+        current.id == None,
+    ).with_entities(func.count(other.id)).scalar()
+
+    def make_query(category):
+        if category == 'removed':
+            query = joined(other, other_build_id, current, build_id).filter(current.id == None)
+        else:
+            query = joined(current, build_id, other, other_build_id).filter(conditions[category])
+
+        return query.with_entities(
+            db.Case.id,
+            db.Case.name,
+            current.status.label('status'),
+            other.status.label('other_status'),
+        )
+
+    return make_query, counts
+
+
+def failure_groups(query, limit, samples):
+    """
+    Group failed case results of query by fingerprint of reason.
+    Query should be filtered by job of case and by build or dates.
+    Returns list of groups ordered by count descending.
+    """
+    query = query.filter(db.CaseResult.fingerprint != None).order_by(None)
+
+    groups = query.with_entities(
+        db.CaseResult.fingerprint,
+        func.count(db.CaseResult.id).label('count'),
+        func.min(db.CaseResult.date),
+        func.max(db.CaseResult.date),
+    ).group_by(
+        db.CaseResult.fingerprint,
+    ).order_by(desc('count')).limit(limit).all()
+
+    if not groups:
+        return []
+
+    # the latest samples of every group are taken by one union
+    # of queries with limit, reason is read for the latest one only
+    subqueries = [
+        query.with_entities(
+            db.CaseResult.fingerprint, db.CaseResult.id, db.Case.name,
+        ).filter(
+            db.CaseResult.fingerprint == g[0],
+        ).order_by(
+            desc(db.CaseResult.date), desc(db.CaseResult.id),
+        ).limit(samples).subquery()
+        for g in groups
+    ]
+
+    latest = dict((g[0], []) for g in groups)
+
+    for fingerprint, case_result_id, name in alchemy.session.execute(
+        union_all(*[select(list(s.c)) for s in subqueries]),
+    ):
+        latest[fingerprint].append((case_result_id, name))
+
+    first_ids = [rows[0][0] for rows in latest.values() if rows]
+    reasons = dict(
+        alchemy.session.query(db.CaseResult.id, db.CaseResult.reason).filter(
+            db.CaseResult.id.in_(first_ids),
+        ),
+    ) if first_ids else {}
+
+    return [
+        {
+            'fingerprint': fingerprint,
+            'count': count,
+            'first_seen': first_seen,
+            'last_seen': last_seen,
+            'reason': reasons.get(latest[fingerprint][0][0]) if latest[fingerprint] else None,
+            'cases': [name for _, name in latest[fingerprint]],
+        }
+        for fingerprint, count, first_seen, last_seen in groups
+    ]
+
+
+def fill_fingerprints(chunk_size=FINGERPRINT_CHUNK_SIZE, recompute=False):
+    """
+    Compute fingerprints of failed case results what were added before
+    fingerprints by chunks, every chunk in its own transaction.
+    With recompute stored fingerprints are computed again,
+    it's needed when normalization of reasons is changed.
+    Returns count of updated case results.
+    """
+    table = db.CaseResult.__table__
+    statement = table.update().where(
+        table.c.id == bindparam('b_id'),
+    ).values(fingerprint=bindparam('b_fingerprint'))
+
+    last_id = 0
+    count = 0
+
+    while True:
+        query = alchemy.session.query(
+            db.CaseResult.id, db.CaseResult.status, db.CaseResult.reason, db.CaseResult.fingerprint,
+        ).filter(
+            db.CaseResult.id > last_id,
+            db.CaseResult.status.in_(FAILED_STATUSES),
+        )
+
+        if not recompute:
+            query = query.filter(db.CaseResult.fingerprint == None)
+
+        rows = query.order_by(db.CaseResult.id).limit(chunk_size).all()
+
+        if not rows:
+            return count
+
+        params = []
+
+        for case_result_id, status, reason, stored in rows:
+            fingerprint = make_fingerprint(status, reason)
+
+            if fingerprint is not None and fingerprint != stored:
+                params.append({'b_id': case_result_id, 'b_fingerprint': fingerprint})
+
+        if params:
+            alchemy.session.execute(statement, params)
+
+        alchemy.session.commit()
+
+        last_id = rows[-1][0]
+        count += len(params)
@@ -11,3 +11,7 @@ class ValidationError(BaseSeismaException):
 
 class NotFound(BaseSeismaException):
     pass
+
+
+class RequestEntityTooLarge(BaseSeismaException):
+    pass
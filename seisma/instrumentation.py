@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""
+Instrumentation of requests.
+
+Count and time of SQL statements, time of validation and serialization
+are collected per request. They are sent in Server-Timing header
+and slow requests are logged with the most expensive statements.
+"""
+
+import time
+import heapq
+import logging
+
+import flask
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_SERVER_TIMING = True
+DEFAULT_SLOW_REQUEST_TIME = 1.0
+DEFAULT_TOP_STATEMENTS = 5
+
+# start time is kept on execution context of statement,
+# so it's dropped together with context of failed statement
+QUERY_START_ATTR = '_seisma_query_start'
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and flask.has_request_context():
+        setattr(context, QUERY_START_ATTR, time.time())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, QUERY_START_ATTR, None)
+
+    if started is None or not flask.has_request_context():
+        return
+
+    elapsed = time.time() - started
+    statements = getattr(flask.g, 'sql_statements', None)
+
+    if statements is None:
+        return
+
+    flask.g.sql_count += 1
+    flask.g.sql_time += elapsed
+
+    # the same statements are grouped, parameters are not kept
+    item = statements.get(statement)
+
+    if item is None:
+        statements[statement] = [1, elapsed]
+    else:
+        item[0] += 1
+        item[1] += elapsed
+
+
+def start_request():
+    flask.g.request_started = time.time()
+    flask.g.sql_count = 0
+    flask.g.sql_time = 0.0
+    flask.g.sql_statements = {}
+
+
+def server_timing(metrics):
+    return ', '.join(
+        '{};dur={:.2f}{}'.format(name, seconds * 1000, ';desc="{}"'.format(desc) if desc else '')
+        for name, seconds, desc in metrics
+    )
+
+
+def finish_request(response, config):
+    started = getattr(flask.g, 'request_started', None)
+
+    if started is None:
+        return response
+
+    total = time.time() - started
+    validation_time = getattr(flask.g, 'validation_time', 0.0)
+    serialization_time = getattr(flask.g, 'serialization_time', 0.0)
+
+    if config.get('SERVER_TIMING', DEFAULT_SERVER_TIMING):
+        response.headers['Server-Timing'] = server_timing([
+            ('db', flask.g.sql_time, '{} queries'.format(flask.g.sql_count)),
+            ('validate', validation_time, None),
+            ('serialize', serialization_time, None),
+            ('total', total, None),
+        ])
+
+    if total >= config.get('SLOW_REQUEST_TIME', DEFAULT_SLOW_REQUEST_TIME):
+        top = heapq.nlargest(
+            config.get('TOP_STATEMENTS', DEFAULT_TOP_STATEMENTS),
+            flask.g.sql_statements.items(),
+            key=lambda item: item[1][1],
+        )
+
+        logger.warning(
+            'Slow request %s %s, status %d, %.1f ms, %d queries %.1f ms, '
+            'validation %.1f ms, serialization %.1f ms, top statements:\n%s',
+            flask.request.method, flask.request.path, response.status_code, total * 1000,
+            flask.g.sql_count, flask.g.sql_time * 1000,
+            validation_time * 1000, serialization_time * 1000,
+            '\n'.join(
+                '{:.1f} ms, {} times: {}'.format(seconds * 1000, count, statement)
+                for statement, (count, seconds) in top
+            ),
+            extra={
+                'method': flask.request.method,
+                'path': flask.request.path,
+                'status': response.status_code,
+                'time': total,
+                'sql_time': flask.g.sql_time,
+                'sql_count': flask.g.sql_count,
+                'validation_time': validation_time,
+                'serialization_time': serialization_time,
+                'statements': [
+                    {'statement': statement, 'count': count, 'time': seconds}
+                    for statement, (count, seconds) in top
+                ],
+            },
+        )
+
+    return response
+
+
+def setup(app):
+    config = app.config.get('INSTRUMENTATION', {})
+
+    if not config.get('ENABLED', False):
+        return
+
+    # all engines, so engine can be created later than instrumentation
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+    app.before_request(start_request)
+    app.after_request(lambda response: finish_request(response, config))
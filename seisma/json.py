@@ -3,18 +3,26 @@
 from __future__ import absolute_import
 
 import datetime
+import operator
 import json as _json
 import simplejson as _sjson
 from sqlalchemy.engine.result import RowProxy
 
 from seisma.database.alchemy import ModelMixin
 
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
 
 DATE_FORMAT = '%Y-%m-%d'
 DATETIME_FORMAT = '%Y-%m-%d %H:%M'
 
 JSON_MIME_TYPE = 'application/json'
 
+DEFAULT_BACKEND = 'json'
+
 
 def json_serial(obj):
     if isinstance(obj, ModelMixin):
@@ -34,10 +42,39 @@ def json_serial(obj):
     )
 
 
-def dumps(obj, **kwargs):
+def json_dumps(obj, **kwargs):
     return _json.dumps(obj, default=json_serial, **kwargs)
 
 
+def simplejson_dumps(obj, **kwargs):
+    return _sjson.dumps(obj, default=json_serial, **kwargs)
+
+
+def orjson_dumps(obj, **kwargs):
+    # orjson has no options of standard library
+    if kwargs:
+        return json_dumps(obj, **kwargs)
+
+    return _orjson.dumps(
+        obj,
+        default=json_serial,
+        option=_orjson.OPT_PASSTHROUGH_DATETIME,
+    ).decode('utf-8')
+
+
+BACKENDS = {
+    'json': json_dumps,
+    'simplejson': simplejson_dumps,
+    'orjson': orjson_dumps,
+}
+
+_dumps = json_dumps
+
+
+def dumps(obj, **kwargs):
+    return _dumps(obj, **kwargs)
+
+
 def dump(fp, **kwargs):
     return _json.dump(fp, default=json_serial, **kwargs)
 
@@ -46,15 +83,71 @@ load = _sjson.load
 loads = _sjson.loads
 
 
+def set_backend(name):
+    global _dumps
+
+    if name not in BACKENDS:
+        raise RuntimeError(
+            'JSON backend "{}" is not in ({})'.format(name, ', '.join(sorted(BACKENDS))),
+        )
+
+    if name == 'orjson' and _orjson is None:
+        raise RuntimeError('JSON backend "orjson" is not installed')
+
+    _dumps = BACKENDS[name]
+
+
+def setup(app):
+    set_backend(app.config.get('JSON_BACKEND', DEFAULT_BACKEND))
+
+
+def format_datetime(value):
+    return value.strftime(DATETIME_FORMAT)
+
+
+def format_date(value):
+    return value.strftime(DATE_FORMAT)
+
+
+VALUE_CONVERTERS = {
+    datetime.datetime: format_datetime,
+    datetime.date: format_date,
+}
+
+
+def convert_value(value):
+    convert = VALUE_CONVERTERS.get(type(value))
+
+    if convert is not None:
+        return convert(value)
+
+    if isinstance(value, ModelMixin):
+        return value.to_dict()
+
+    return value
+
+
 class BaseConverterRule(object):
 
     def __call__(self, instance):
+        key, getter = self.compile()
+        return key, getter(instance)
+
+    def compile(self):
+        """
+        Returns key and function what gets value from instance.
+        """
         raise NotImplementedError(
-            '"{}" is not callable'.format(self.__class__.__name__),
+            '"{}" can not be compiled'.format(self.__class__.__name__),
         )
 
 
 class ObjectConverter(object):
+    """
+    Converts instance to dictionary by rules.
+    Rules are compiled to one function when converter is created,
+    values of dates and models are converted to be ready for json.
+    """
 
     class FromAttribute(BaseConverterRule):
 
@@ -62,8 +155,8 @@ class ObjectConverter(object):
             self.alias = alias
             self.attr_name = attr_name
 
-        def __call__(self, instance):
-            return self.alias or self.attr_name, getattr(instance, self.attr_name)
+        def compile(self):
+            return self.alias or self.attr_name, operator.attrgetter(self.attr_name)
 
     class FromMethod(BaseConverterRule):
 
@@ -71,9 +164,8 @@ class ObjectConverter(object):
             self.alias = alias
             self.method_name = method_name
 
-        def __call__(self, instance):
-            method = getattr(instance, self.method_name)
-            return self.alias or self.method_name, method()
+        def compile(self):
+            return self.alias or self.method_name, operator.methodcaller(self.method_name)
 
     class FromItem(BaseConverterRule):
 
@@ -81,18 +173,28 @@ class ObjectConverter(object):
             self.alias = alias
             self.item_name = item_name
 
-        def __call__(self, instance):
-            return self.alias or self.item_name, instance[self.item_name]
+        def compile(self):
+            return self.alias or self.item_name, operator.itemgetter(self.item_name)
 
     def __init__(self, *rules, **options):
         self.rules = rules
         self.is_callable = options.get('is_callable', True)
+        self.convert = self.compile(rules)
+
+    @staticmethod
+    def compile(rules):
+        getters = tuple(rule.compile() for rule in rules)
+
+        def convert(instance):
+            return {key: convert_value(get(instance)) for key, get in getters}
+
+        return convert
 
     def __get__(self, instance, owner):
         if instance is None:
             return self
 
         if self.is_callable:
-            return lambda: dict(rule(instance) for rule in self.rules)
+            return self.convert.__get__(instance, owner)
 
-        return dict(rule(instance) for rule in self.rules)
+        return self.convert(instance)
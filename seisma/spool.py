@@ -0,0 +1,481 @@
+# -*- coding: utf-8 -*-
+
+"""
+Write-behind ingest of builds and case results.
+
+Requests append records to a spool file of the process and return
+at once, a background thread writes records to database by batches.
+Spool files of crashed processes are replayed when flusher is started.
+Spool of the process is flushed at once before reads and stop of build,
+case results of unknown build are appended again while it's not too old,
+the build could be in spool of another process yet.
+"""
+
+import os
+import glob
+import fcntl
+import atexit
+import socket
+import logging
+import datetime
+import threading
+import json as _json
+
+import flask
+from sqlalchemy.exc import OperationalError
+
+from . import constants
+from .database import cache
+from .database import ingest
+from .database import schema as db
+from .database.alchemy import alchemy
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_FSYNC = True
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_ORPHAN_TIMEOUT = 60 * 10
+DEFAULT_SPOOL_DIR = os.path.join(constants.SEISMA_DATA_DIR, 'spool')
+
+SPOOL_FILE_EXTENSION = '.spool'
+OFFSET_FILE_EXTENSION = '.offset'
+
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+BUILD_RECORD = 'build'
+CASE_RESULT_RECORD = 'case_result'
+
+READ_METHODS = frozenset(['GET', 'HEAD'])
+
+
+current = None
+flusher = None
+
+
+class Spool(object):
+    """
+    Append-only file of records, one json per line.
+    File is locked by the owner process while it's opened,
+    offset of flushed records is kept in a separate file.
+    """
+
+    def __init__(self, path, fsync=DEFAULT_FSYNC):
+        self.path = path
+        self.fsync = fsync
+        self.offset_path = path + OFFSET_FILE_EXTENSION
+
+        self._lock = threading.Lock()
+        self._fp = open(path, 'ab')
+
+        # records are written by one thread at a time
+        self.flush_lock = threading.Lock()
+
+        try:
+            fcntl.flock(self._fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._fp.close()
+            raise
+
+    def __repr__(self):
+        return '<Spool: {}>'.format(self.path)
+
+    def close(self):
+        self._fp.close()
+
+    def remove(self):
+        for path in (self.offset_path, self.path):
+            if os.path.exists(path):
+                os.remove(path)
+
+        self.close()
+
+    def size(self):
+        return os.fstat(self._fp.fileno()).st_size
+
+    def append(self, record):
+        line = _json.dumps(record).encode('utf-8') + b'\n'
+
+        with self._lock:
+            self._fp.write(line)
+            self._fp.flush()
+
+            if self.fsync:
+                os.fsync(self._fp.fileno())
+
+    def get_offset(self):
+        try:
+            with open(self.offset_path) as fp:
+                offset = int(fp.read() or 0)
+        except (IOError, ValueError):
+            offset = 0
+
+        # file could be truncated before offset was written
+        return offset if offset <= self.size() else 0
+
+    def read(self, offset, limit, end=None):
+        """
+        Read complete records after offset and before end.
+        Returns list of records and offset after them.
+        """
+        records = []
+
+        with open(self.path, 'rb') as fp:
+            fp.seek(offset)
+
+            while len(records) < limit and (end is None or offset < end):
+                line = fp.readline()
+
+                if not line.endswith(b'\n'):
+                    break
+
+                offset += len(line)
+
+                try:
+                    records.append(_json.loads(line.decode('utf-8')))
+                except ValueError:
+                    logger.error('Broken record of %s is skipped: %r', self, line)
+
+        return records, offset
+
+    def commit(self, offset):
+        """
+        Remember offset of flushed records.
+        File is truncated when all records are flushed.
+        """
+        with self._lock:
+            if offset == self.size():
+                self._fp.truncate(0)
+                offset = 0
+
+            tmp_path = self.offset_path + '.tmp'
+
+            with open(tmp_path, 'w') as fp:
+                fp.write(str(offset))
+                fp.flush()
+                os.fsync(fp.fileno())
+
+            os.rename(tmp_path, self.offset_path)
+
+
+def dump_date(value):
+    return value.strftime(DATETIME_FORMAT)
+
+
+def load_date(value):
+    return datetime.datetime.strptime(value, DATETIME_FORMAT)
+
+
+def write_build(record):
+    job_id = db.Job.get_id_by_name(record['job'])
+
+    if job_id is None and record['autocreation']:
+        job = db.Job.create(commit=False, name=record['job'], is_active=True)
+        cache.remember_job(job)
+        job_id = job.id
+
+    if job_id is None:
+        logger.warning('Job "%s" is not found, build "%s" is dropped', record['job'], record['build'])
+        return
+
+    build = db.Build.create(
+        commit=False,
+        job_id=job_id,
+        name=record['build'],
+        date=load_date(record['date']),
+        runtime=0.0,
+        fail_count=0,
+        error_count=0,
+        tests_count=0,
+        success_count=0,
+        is_running=True,
+        was_success=False,
+    )
+
+    if record['metadata']:
+        build.md = record['metadata']
+
+
+def write_case_results(records, orphan_timeout=DEFAULT_ORPHAN_TIMEOUT):
+    """
+    Write case results of one build.
+    Returns records what should be written later.
+    """
+    first = records[0]
+
+    job_id = db.Job.get_id_by_name(first['job'])
+    build_id = db.Build.get_id_by_name(job_id, first['build']) if job_id else None
+
+    if build_id is None:
+        expired = datetime.datetime.now() - datetime.timedelta(seconds=orphan_timeout)
+
+        if load_date(first['date']) > expired:
+            return records
+
+        logger.warning(
+            'Build "%s" of job "%s" is not found, %d case results are dropped',
+            first['build'], first['job'], len(records),
+        )
+        return []
+
+    outcomes = ingest.add_case_results(
+        job_id, build_id,
+        [r['result'] for r in records],
+        autocreation=first['autocreation'],
+        commit=False,
+        dates=[load_date(r['date']) for r in records],
+    )
+
+    for outcome in outcomes:
+        if not outcome['created']:
+            logger.warning('Case result is dropped: %s', ', '.join(outcome['messages']))
+
+    return []
+
+
+def write_records(records, orphan_timeout=DEFAULT_ORPHAN_TIMEOUT):
+    """
+    Write records to database in one transaction.
+    Neighbour case results of one build are written together.
+    Returns records what should be written later.
+    """
+    group = []
+    group_key = None
+    postponed = []
+
+    for record in records:
+        if record['type'] == CASE_RESULT_RECORD:
+            key = (record['job'], record['build'], record['autocreation'])
+
+            if group and key != group_key:
+                postponed.extend(write_case_results(group, orphan_timeout))
+                group = []
+
+            group_key = key
+            group.append(record)
+        else:
+            if group:
+                postponed.extend(write_case_results(group, orphan_timeout))
+                group = []
+
+            write_build(record)
+
+    if group:
+        postponed.extend(write_case_results(group, orphan_timeout))
+
+    alchemy.session.commit()
+
+    return postponed
+
+
+def flush(spool, batch_size=DEFAULT_BATCH_SIZE, orphan_timeout=DEFAULT_ORPHAN_TIMEOUT, requeue=None):
+    """
+    Write complete records of spool to database.
+    Database errors break flushing, records will be written next time.
+    Postponed records are appended to requeue spool, spool itself by default,
+    and they are read by the next flush only.
+    Records what can not be written by other reasons are dropped.
+    """
+    requeue = requeue or spool
+
+    with spool.flush_lock:
+        end = spool.size()
+
+        while True:
+            offset = spool.get_offset()
+            records, next_offset = spool.read(offset, batch_size, end=end)
+
+            if next_offset == offset:
+                return
+
+            try:
+                postponed = write_records(records, orphan_timeout)
+            except OperationalError:
+                alchemy.session.rollback()
+                raise
+            except Exception:
+                alchemy.session.rollback()
+                logger.error('Batch of %s is failed, records will be written one by one', spool, exc_info=True)
+
+                postponed = []
+
+                for record in records:
+                    try:
+                        postponed.extend(write_records([record], orphan_timeout))
+                    except OperationalError:
+                        alchemy.session.rollback()
+                        raise
+                    except Exception:
+                        alchemy.session.rollback()
+                        logger.error('Record is dropped: %s', record, exc_info=True)
+
+            for record in postponed:
+                requeue.append(record)
+
+            spool.commit(next_offset)
+
+
+def recover(directory, requeue, batch_size=DEFAULT_BATCH_SIZE, orphan_timeout=DEFAULT_ORPHAN_TIMEOUT):
+    """
+    Replay spool files what are not locked by alive processes.
+    Postponed records are appended to requeue spool.
+    """
+    for path in glob.glob(os.path.join(directory, '*' + SPOOL_FILE_EXTENSION)):
+        try:
+            spool = Spool(path)
+        except OSError:
+            continue
+
+        logger.info('Recovering of %s', spool)
+
+        try:
+            flush(spool, batch_size=batch_size, orphan_timeout=orphan_timeout, requeue=requeue)
+        except Exception:
+            spool.close()
+            raise
+
+        if spool.get_offset() != 0:
+            logger.warning('Incomplete record at the end of %s is dropped', spool)
+
+        spool.remove()
+
+
+class Flusher(threading.Thread):
+
+    def __init__(self, app, spool,
+                 interval=DEFAULT_FLUSH_INTERVAL,
+                 batch_size=DEFAULT_BATCH_SIZE,
+                 orphan_timeout=DEFAULT_ORPHAN_TIMEOUT):
+        super(Flusher, self).__init__(name='seisma-spool-flusher')
+
+        self.daemon = True
+
+        self.app = app
+        self.spool = spool
+        self.interval = interval
+        self.batch_size = batch_size
+        self.orphan_timeout = orphan_timeout
+
+        self._stopped = threading.Event()
+
+    def run(self):
+        recovered = False
+
+        while True:
+            try:
+                with self.app.app_context():
+                    if not recovered:
+                        recover(
+                            os.path.dirname(self.spool.path), self.spool,
+                            batch_size=self.batch_size,
+                            orphan_timeout=self.orphan_timeout,
+                        )
+                        recovered = True
+
+                    flush(self.spool, batch_size=self.batch_size, orphan_timeout=self.orphan_timeout)
+            except Exception:
+                logger.error('Spool is not flushed, it will be tried again', exc_info=True)
+
+            if self._stopped.is_set():
+                break
+
+            self._stopped.wait(self.interval)
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self.join(timeout)
+
+
+def is_enabled():
+    return current is not None
+
+
+def make_build_record(job_name, build_name, metadata, autocreation=False):
+    return {
+        'type': BUILD_RECORD,
+        'job': job_name,
+        'build': build_name,
+        'date': dump_date(datetime.datetime.now()),
+        'metadata': metadata,
+        'autocreation': autocreation,
+    }
+
+
+def make_case_result_record(job_name, build_name, case_name, data, autocreation=False):
+    return {
+        'type': CASE_RESULT_RECORD,
+        'job': job_name,
+        'build': build_name,
+        'date': dump_date(datetime.datetime.now()),
+        'result': dict(data, name=case_name),
+        'autocreation': autocreation,
+    }
+
+
+def append_build(job_name, build_name, metadata, autocreation=False):
+    current.append(make_build_record(job_name, build_name, metadata, autocreation=autocreation))
+
+
+def append_case_result(job_name, build_name, case_name, data, autocreation=False):
+    current.append(make_case_result_record(job_name, build_name, case_name, data, autocreation=autocreation))
+
+
+def flush_current():
+    """
+    Write records of spool of the process before they are read.
+    Records of spool files of other processes are not seen.
+    """
+    if current is not None:
+        config = flask.current_app.config.get('INGEST', {})
+
+        flush(
+            current,
+            batch_size=config.get('BATCH_SIZE', DEFAULT_BATCH_SIZE),
+            orphan_timeout=config.get('ORPHAN_TIMEOUT', DEFAULT_ORPHAN_TIMEOUT),
+        )
+
+
+def flush_before_read():
+    if current is not None and flask.request.method in READ_METHODS:
+        try:
+            flush_current()
+        except Exception:
+            logger.error('Spool is not flushed before read', exc_info=True)
+
+
+def start(app):
+    global current, flusher
+
+    config = app.config.get('INGEST', {})
+    directory = config.get('SPOOL_DIR') or DEFAULT_SPOOL_DIR
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    path = os.path.join(
+        directory,
+        '{}-{}{}'.format(socket.gethostname(), os.getpid(), SPOOL_FILE_EXTENSION),
+    )
+
+    current = Spool(path, fsync=config.get('FSYNC', DEFAULT_FSYNC))
+    flusher = Flusher(
+        app, current,
+        interval=config.get('FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+        batch_size=config.get('BATCH_SIZE', DEFAULT_BATCH_SIZE),
+        orphan_timeout=config.get('ORPHAN_TIMEOUT', DEFAULT_ORPHAN_TIMEOUT),
+    )
+    flusher.start()
+
+    atexit.register(flusher.stop)
+
+
+def setup(app):
+    config = app.config.get('INGEST', {})
+
+    if config.get('SPOOL', False):
+        # thread is started in worker process, not before fork
+        app.before_first_request(lambda: start(app))
+
+    app.before_request(flush_before_read)